@@ -1,4 +1,8 @@
 from django.contrib import admin
+from django.db.models import Exists, OuterRef
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils.html import format_html, format_html_join
 from django.utils.html import urlize
 from django.utils.safestring import mark_safe
 
@@ -8,19 +12,27 @@ from simple_history.admin import SimpleHistoryAdmin
 
 # Register your models here.
 
-from .models import Contact, Tower, ContactMap, Website, DoveTower
+from .models import Contact, Tower, TowerChange, ContactMap, Website, DoveRing, ReconcileIssue
+from .search import matching, search
 
 admin.site.site_header = "Ely DA Tower Database"
 admin.site.site_title = "Database admin"
 admin.site.index_title = "Database admin"
 
 
+# Inline rows print ContactMap.__str__ / Website.__str__, which follow
+# the tower and contact FKs, so fetch those up front
+
 class ContactInline(admin.TabularInline):
     model = Tower.other_contacts.through
     verbose_name = "other contact"
     extra = 0
+    autocomplete_fields = ["contact"]
     #classes = ["collapse"]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("tower", "contact")
+
 class PrimaryContactInline(admin.TabularInline):
     model = Tower
     fields = ["__str__"]
@@ -37,23 +49,75 @@ class TowerInline(admin.TabularInline):
     extra = 0
     can_delete = False
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("tower", "contact")
+
 class WebsiteInline(admin.TabularInline):
     model = Website
     extra = 0
     #classes = ["collapse"]
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("tower")
+
+class IndexedSearchMixin:
+
+    """
+    Search (and search-as-you-type) using the index in database.search,
+    rather than icontains on each of search_fields, if it has been built
+    """
+
+    search_kind = None
+
+    def get_search_results(self, request, queryset, search_term):
+        found = matching(self.search_kind, search_term) if search_term else None
+        if found is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(found), False
+
+    def search_api(self, request, search_term):
+        pks = search(self.search_kind, search_term, limit=self.max_results)
+        if pks is None:
+            return super().search_api(request, search_term)
+        objects = self.model.objects.in_bulk(pks)
+        return JsonResponse(data=[{'keyword': self.get_instance_name(objects[pk]), 'url': self.get_instance_url(objects[pk])}
+                                  for pk in pks if pk in objects], safe=False)
+
+class DoveDiscrepancyFilter(admin.SimpleListFilter):
+
+    """
+    Towers with (or without) open ReconcileIssues, as last found by
+    reconsile_with_dove
+    """
+
+    title = "Dove discrepancies"
+    parameter_name = "dove_issues"
+
+    def lookups(self, request, model_admin):
+        return [("open", "Open"), ("none", "None")]
+
+    def queryset(self, request, queryset):
+        issues = Exists(ReconcileIssue.objects.filter(tower=OuterRef("pk"), resolved_at__isnull=True))
+        if self.value() == "open":
+            return queryset.filter(issues)
+        if self.value() == "none":
+            return queryset.filter(~issues)
+        return queryset
+
 class ContactAdmin(SearchAutoCompleteAdmin, SimpleHistoryAdmin):
     inlines= [PrimaryContactInline, TowerInline]
     search_fields = ["name", "phone", "email"]
     search_help_text = "Search by name, phone number or email"
 
-class TowerAdmin(SearchAutoCompleteAdmin, SimpleHistoryAdmin):
+class TowerAdmin(IndexedSearchMixin, SearchAutoCompleteAdmin, SimpleHistoryAdmin):
     inlines = [WebsiteInline, ContactInline]
     list_display = ["__str__", "district", "bells"]
-    list_filter = ["district", "report", "bells", "ringing_status", "ring_type", "practice_day"]
+    list_filter = ["district", "report", "bells", "ringing_status", "ring_type", "practice_day", DoveDiscrepancyFilter]
     search_fields = ["place", "dedication", "full_dedication", "nickname"]
+    search_kind = "tower"
     search_help_text = "Search by place or dedication"
-    readonly_fields = ["dove_link_html", "bellboard_link_html", "felstead_link_html"]
+    readonly_fields = ["dove_link_html", "bellboard_link_html", "felstead_link_html", "change_log_html"]
+    autocomplete_fields = ["primary_contact"]
 
     def dove_link_html(self, instance):
         return mark_safe(urlize(instance.dove_link, nofollow=True, autoescape=True))
@@ -64,6 +128,13 @@ class TowerAdmin(SearchAutoCompleteAdmin, SimpleHistoryAdmin):
     def felstead_link_html(self, instance):
         return mark_safe(urlize(instance.felstead_link, nofollow=True, autoescape=True))
 
+    @admin.display(description="Change log")
+    def change_log_html(self, instance):
+        if instance.pk is None:
+            return "-"
+        return format_html('<a href="{}?tower_id={}">Changes to this tower</a>',
+                           reverse("admin:database_towerchange_changelist"), instance.pk)
+
     fieldsets = [
         (
             None, {
@@ -127,13 +198,15 @@ class TowerAdmin(SearchAutoCompleteAdmin, SimpleHistoryAdmin):
                     "notes",
                     "long_notes",
                     "maintainer_notes",
+                    "change_log_html",
                 )
             }
         )
     ]
 
-class DoveTowerAdmin(SearchAutoCompleteAdmin):
+class DoveRingAdmin(IndexedSearchMixin, SearchAutoCompleteAdmin):
     search_fields = ["place", "dedicn", "towerid", "ringid"]
+    search_kind = "dove"
     search_help_text = "Search by place or dedication (or tower or ring  ID)"
     list_display = ["__str__", "bells"]
     list_filter = ["bells", "ringtype", ("ur", admin.EmptyFieldListFilter), "county", "country", "diocese"]
@@ -147,6 +220,53 @@ class DoveTowerAdmin(SearchAutoCompleteAdmin):
     def has_add_permission(self, request):
         return False
 
+class TowerChangeAdmin(admin.ModelAdmin):
+    list_display = ["history_date", "tower", "history_type", "user", "changes_html"]
+    list_filter = ["history_type", "history_date"]
+    list_select_related = ["history__history_user"]
+    date_hierarchy = "history_date"
+    list_per_page = 50
+
+    @admin.display(description="Tower", ordering="history__place")
+    def tower(self, obj):
+        return f'{obj.history.place}  ({obj.history.dedication})'
+
+    @admin.display(description="User")
+    def user(self, obj):
+        return obj.history.history_user or "-"
+
+    @admin.display(description="Changes")
+    def changes_html(self, obj):
+        return format_html_join(mark_safe("<br>"), "<b>{}</b>: {} &rarr; {}",
+                                ((field, "-" if old in (None, "") else old, "-" if new in (None, "") else new)
+                                 for field, old, new in obj.changes))
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+class ReconcileIssueAdmin(admin.ModelAdmin):
+    list_display = ["tower", "test", "ours", "theirs", "first_seen", "resolved_at"]
+    list_filter = [("resolved_at", admin.EmptyFieldListFilter), "test", "first_seen"]
+    list_select_related = ["tower"]
+    list_per_page = 50
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
 admin.site.register(Contact, ContactAdmin)
 admin.site.register(Tower, TowerAdmin)
-admin.site.register(DoveTower, DoveTowerAdmin)
+admin.site.register(DoveRing, DoveRingAdmin)
+admin.site.register(TowerChange, TowerChangeAdmin)
+admin.site.register(ReconcileIssue, ReconcileIssueAdmin)
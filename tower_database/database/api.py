@@ -0,0 +1,107 @@
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.db.models import F, Prefetch
+from django.utils import timezone
+
+from .models import ContactMap, DataVersion, Tower
+
+# Tower fields included in the API
+TOWER_FIELDS = ('place', 'county', 'dedication', 'full_dedication', 'nickname', 'district', 'include_dedication',
+                'ringing_status', 'service', 'practice', 'practice_day', 'practice_weeks', 'travel_check',
+                'bells', 'ring_type', 'weight', 'note', 'gf', 'os_grid', 'postcode', 'lat', 'lng',
+                'peals', 'dove_towerid', 'dove_ringid', 'towerbase_id', 'notes', 'long_notes')
+
+
+def data_version():
+    """(version, when it last changed) of the data served by the API"""
+    version = DataVersion.objects.filter(pk=1).values_list('version', 'changed').first()
+    if version is None:
+        row, created = DataVersion.objects.get_or_create(pk=1)
+        version = (row.version, row.changed)
+    return version
+
+
+def bump_data_version():
+    # In the database, so that concurrent bumps can't lose one another
+    if not DataVersion.objects.filter(pk=1).update(version=F('version') + 1, changed=timezone.now()):
+        DataVersion.objects.get_or_create(pk=1, defaults={'version': 2})
+
+
+def queue_data_version_bump():
+
+    """
+    bump_data_version() once the current transaction commits (so that
+    nobody caches the old data as the new version), queued at most once
+    however many rows the transaction changes
+    """
+
+    # The queued callback, unless it has run. It is also gone from
+    # run_on_commit if the transaction (or savepoint) was rolled back.
+    queued = getattr(connection, 'data_version_bump', None)
+    if queued is not None and any(queued in callback for callback in connection.run_on_commit):
+        return
+
+    def bump():
+        connection.data_version_bump = None
+        bump_data_version()
+
+    connection.data_version_bump = bump
+    transaction.on_commit(bump)
+
+
+def contacts(tower):
+
+    """
+    A tower's published contacts: its primary contact and the other
+    contacts marked publish, or none at all if its contact_use is 'None'
+    """
+
+    if tower.contact_use == Tower.ContactUses.NONE:
+        return []
+
+    def details(contact, **extra):
+        return {'name': contact.name, 'phone': contact.phone, 'phone2': contact.phone2, 'email': contact.email, **extra}
+
+    result = []
+    if tower.primary_contact:
+        result.append(details(tower.primary_contact, role='Primary contact', use=tower.contact_use))
+    result += [details(m.contact, role=m.get_role_display()) for m in tower.published_contacts]
+    return result
+
+
+def tower_payloads():
+    """A dict mapping tower id to its API representation, built with three queries"""
+    towers = (Tower.objects.select_related('primary_contact')
+              .prefetch_related('website_set',
+                                Prefetch('contactmap_set', to_attr='published_contacts',
+                                         queryset=ContactMap.objects.filter(publish=True).select_related('contact'))))
+    return {
+        tower.pk: {
+            'id': tower.pk,
+            **{field: getattr(tower, field) for field in TOWER_FIELDS},
+            'websites': [website.website for website in tower.website_set.all()],
+            'contacts': contacts(tower),
+        }
+        for tower in towers
+    }
+
+
+def version_tag(version):
+    """
+    A string identifying a data_version(), with the time as well as the
+    count, so that it is never reused even if the database is restored
+    from a backup
+    """
+    number, changed = version
+    return f'{number}-{changed.timestamp():.6f}'
+
+
+def cached_tower_payloads(version):
+    """tower_payloads(), cached against a data_version()"""
+    cache = caches['api']
+    key = f'api-towers-{version_tag(version)}'
+    payloads = cache.get(key)
+    if payloads is None:
+        payloads = tower_payloads()
+        cache.set(key, payloads, 24 * 60 * 60)
+    return payloads
@@ -0,0 +1,105 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+
+from functools import lru_cache
+import calendar
+import datetime
+
+from .models import PracticeSlot, Tower
+
+# How long to keep month bitmaps (they are also keyed on the slot data,
+# so this only limits the size of the cache)
+CACHE_SECONDS = 24 * 60 * 60
+
+
+@lru_cache(maxsize=256)
+def month_table(year, month):
+
+    """
+    For one month, a dict mapping (weekday, week of month) to a bitmap of
+    the matching day (bit 0 = the 1st), plus (weekday, None) to a bitmap of
+    every such day (for practices in alternate weeks)
+    """
+
+    table = {}
+    for day in range(1, calendar.monthrange(year, month)[1] + 1):
+        weekday = calendar.weekday(year, month, day)
+        bit = 1 << (day - 1)
+        table[(weekday, (day - 1) // 7 + 1)] = bit
+        table[(weekday, None)] = table.get((weekday, None), 0) | bit
+    return table
+
+
+def rebuild_practice_slots():
+
+    """
+    Recreate every PracticeSlot from the towers. Returns the number created.
+    """
+
+    with transaction.atomic():
+        PracticeSlot.objects.all().delete()
+        slots = [slot for tower in Tower.objects.all() for slot in tower.get_practice_slots()]
+        PracticeSlot.objects.bulk_create(slots, batch_size=1000)
+    return len(slots)
+
+
+def slots_version():
+
+    """
+    Changes whenever any PracticeSlot does (they are recreated, so with
+    new ids, whenever a tower is saved)
+    """
+
+    v = PracticeSlot.objects.aggregate(count=Count('id'), max=Max('id'))
+    return f"{v['count']}-{v['max']}"
+
+
+def month_bitmaps(year, month, version, slots):
+
+    """
+    A dict mapping tower id to a bitmap of the days in the month it has a
+    practice. slots is a callable returning (tower_id, weekday, week)
+    tuples, only called if the month isn't already cached.
+    """
+
+    key = f'practice-bitmaps-{version}-{year}-{month}'
+    bitmaps = cache.get(key)
+    if bitmaps is None:
+        table = month_table(year, month)
+        bitmaps = {}
+        for tower_id, weekday, week in slots():
+            bitmaps[tower_id] = bitmaps.get(tower_id, 0) | table.get((weekday, week), 0)
+        cache.set(key, bitmaps, CACHE_SECONDS)
+    return bitmaps
+
+
+def practices_between(start, end):
+
+    """
+    Return a list of (date, [tower id, ...]) for every date from start to
+    end inclusive
+    """
+
+    version = slots_version()
+
+    all_slots = None
+
+    def slots():
+        # Fetched at most once, and only if some month isn't cached
+        nonlocal all_slots
+        if all_slots is None:
+            all_slots = list(PracticeSlot.objects.values_list('tower_id', 'weekday', 'week').order_by())
+        return all_slots
+
+    result = []
+    date = start
+    while date <= end:
+        bitmaps = month_bitmaps(date.year, date.month, version, slots)
+        last = min(end, datetime.date(date.year, date.month, calendar.monthrange(date.year, date.month)[1]))
+        while date <= last:
+            bit = 1 << (date.day - 1)
+            result.append((date, sorted(tower_id for tower_id, bitmap in bitmaps.items() if bitmap & bit)))
+            date += datetime.timedelta(days=1)
+
+    return result
@@ -0,0 +1,49 @@
+from functools import lru_cache
+
+from unidecode import unidecode
+
+import re
+
+# Substitutions to convert one of our dedications into Dove style. These are
+# applied in order, so later ones see the result of earlier ones (e.g. 'and'
+# in 'of Holy and Undivided')
+
+DOVE_PATTERNS = (
+
+    (r'\bthe Great\b',                  'Gt'),
+    (r'\bMary Magdalene\b',             'Mary Magd'),
+    (r'\bMary the Virgin\b',            'Mary V'),
+    (r'\bMary the Blessed Virgin\b',    'Mary BV'),
+    (r'\bthe Baptist\b',                'Bapt'),
+    (r'\bthe Evangelist\b',             'Ev'),
+    (r'\bof the Blessed Virgin Mary\b', 'of BVM'),
+    (r' and the Holy Host of Heaven\b', ''),
+    (r'\bCathedral Church\b',           'Cath Ch'),
+    (r'\bthe English Martyrs\b',        'Eng Martyrs'),
+    (r'\bKing and Martyr\b',            'K&M'),
+    (r'\bof the Holy and Undivided\b',  'of Holy and Undivided'),
+    (r'^The ',                          ''),
+    (r'\bSt\b',                         'S'),
+    (r'\band\b',                        '&'),
+
+)
+
+DOVE_SUBSTITUTIONS = tuple((re.compile(pattern), replacement) for pattern, replacement in DOVE_PATTERNS)
+
+# For search terms, which may be typed in any case
+DOVE_SUBSTITUTIONS_IGNORE_CASE = tuple((re.compile(pattern, re.IGNORECASE), replacement) for pattern, replacement in DOVE_PATTERNS)
+
+
+@lru_cache(maxsize=4096)
+def dove_dedication(dedication, ignore_case=False):
+    """
+    Return a dedication converted to the form used by Dove, with accents
+    removed and the usual Dove abbreviations applied.
+    """
+
+    dedication = unidecode(dedication)
+
+    for pattern, replacement in DOVE_SUBSTITUTIONS_IGNORE_CASE if ignore_case else DOVE_SUBSTITUTIONS:
+        dedication = pattern.sub(replacement, dedication)
+
+    return dedication
@@ -0,0 +1,30 @@
+from django.db import connection, models, transaction
+
+from .models import DoveRing, DoveTower
+
+
+def rebuild_dove_rings():
+
+    """
+    Replace every DoveRing with a typed copy of DoveTower, converting in a
+    single INSERT ... SELECT. Blank values become NULL in numeric columns.
+    Returns the number of rows copied.
+    """
+
+    qn = connection.ops.quote_name
+
+    columns = []
+    expressions = []
+    for field in DoveRing._meta.concrete_fields:
+        source = f'TRIM({qn(DoveTower._meta.get_field(field.name).column)})'
+        columns.append(qn(field.column))
+        if isinstance(field, (models.CharField, models.TextField)):
+            expressions.append(f"COALESCE({source}, '')")
+        else:
+            expressions.append(f"CAST(NULLIF({source}, '') AS {field.cast_db_type(connection)})")
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {qn(DoveRing._meta.db_table)}')
+        cursor.execute(f'INSERT INTO {qn(DoveRing._meta.db_table)} ({", ".join(columns)}) '
+                       f'SELECT {", ".join(expressions)} FROM {qn(DoveTower._meta.db_table)}')
+        return cursor.rowcount
@@ -0,0 +1,205 @@
+from django.db import transaction
+
+from simple_history.utils import bulk_update_with_history
+
+from collections import defaultdict
+from difflib import SequenceMatcher
+import math
+
+from .api import queue_data_version_bump
+from .dedications import dove_dedication
+from .geo import GridIndex, haversine
+from .history import record_tower_changes
+from .models import DoveRing, Tower
+from .osgrid import grid_refs_to_wgs84, grid_to_en
+from .search import fold
+
+# Dove rings are only scored against a tower if they share its county and
+# its place name, or a distinctive word of it, or are within SEARCH_MILES
+# of it. That keeps the work proportional to the number of towers rather
+# than towers times Dove rings.
+SEARCH_MILES = 2
+
+# Words too common in place names to block on
+COMMON_WORDS = {'great', 'little', 'north', 'south', 'east', 'west', 'upper', 'lower', 'old', 'new',
+                'cum', 'in', 'on', 'upon', 'next', 'with', 'the', 'by', 'and', 'st', 'saint'}
+
+# How much each part of the score counts; they add up to 1
+WEIGHTS = {'place': 0.15, 'dedication': 0.35, 'distance': 0.35, 'bells': 0.15}
+
+# Distance (in miles) at which the distance part of the score reaches 0
+DISTANCE_SCALE = 2
+
+# A suggestion is applied by --apply only if it scores at least this, and
+# this much more than the next best
+CONFIDENT_SCORE = 0.9
+CONFIDENT_MARGIN = 0.1
+
+DOVE_COLUMNS = ('ringid', 'towerid', 'place', 'place2', 'county', 'dedicn', 'ng', 'lat', 'long', 'bells', 'ringtype')
+
+
+def place_key(place):
+    """A place name with accents, case, hyphens and punctuation folded away"""
+    return ' '.join(fold(place))
+
+
+def place_words(place):
+    return {word for word in fold(place) if word not in COMMON_WORDS and not word.isdigit()}
+
+
+def dedication_key(dedication):
+    return ' '.join(fold(dedication))
+
+
+def dedication_similarity(ours, theirs):
+
+    """
+    How alike (from 0 to 1) one of our dedications and a Dove one are,
+    once ours is in Dove style. One contained in the other (e.g. 'S Mary
+    Gt' in 'Univ Ch of S Mary Gt') counts as nearly the same.
+    """
+
+    ours, theirs = dedication_key(dove_dedication(ours)), dedication_key(theirs)
+    similarity = SequenceMatcher(None, ours, theirs).ratio()
+    if ours and theirs and (f' {ours} ' in f' {theirs} ' or f' {theirs} ' in f' {ours} '):
+        similarity = max(similarity, 0.9)
+    return similarity
+
+
+class BlockingIndex:
+
+    """
+    Dove rings (dicts of DOVE_COLUMNS), looked up by (county, place), by
+    (county, word of place) and by location
+    """
+
+    def __init__(self, rings):
+        self.rings = {}
+        self.by_place = defaultdict(list)
+        self.by_word = defaultdict(list)
+        for ring in rings:
+            self.rings[ring['ringid']] = ring
+            county = ring['county'].lower()
+            for place in (ring['place'], ring['place2']):
+                if place:
+                    self.by_place[(county, place_key(place))].append(ring['ringid'])
+                    for word in place_words(place):
+                        self.by_word[(county, word)].append(ring['ringid'])
+        self.grid = GridIndex((r['ringid'], r['lat'], r['long']) for r in self.rings.values()
+                              if r['lat'] is not None and r['long'] is not None)
+
+    def candidates(self, place, county, here=None):
+
+        """
+        {ringid: how it was found} for the rings in county at place
+        ('place') or sharing a word of its name ('word'), and those within
+        SEARCH_MILES of here, if given ('nearby')
+        """
+
+        county = county.lower()
+        found = {}
+        if here:
+            found.update((ringid, 'nearby') for miles, ringid in self.grid.within(*here, SEARCH_MILES))
+        found.update((ringid, 'word') for word in place_words(place) for ringid in self.by_word.get((county, word), ()))
+        found.update((ringid, 'place') for ringid in self.by_place.get((county, place_key(place)), ()))
+        return found
+
+
+def tower_location(tower, grid):
+    # lat/lng, falling back on the OS grid reference (converted in bulk)
+    if tower.lat is not None and tower.lng is not None:
+        return float(tower.lat), float(tower.lng)
+    return grid
+
+
+def distance(tower, here, ring):
+
+    """
+    Miles between a tower and a Dove ring: between their OS grid references
+    if both have one, otherwise between their latitudes and longitudes.
+    None if it can't be worked out.
+    """
+
+    ours, theirs = grid_to_en(tower.os_grid) if tower.os_grid else None, grid_to_en(ring['ng']) if ring['ng'] else None
+    if ours and theirs:
+        return math.dist(ours, theirs) / 1609.344
+    if here and ring['lat'] is not None and ring['long'] is not None:
+        return haversine(*here, ring['lat'], ring['long'])
+    return None
+
+
+def score(tower, here, ring, matched):
+
+    """
+    (score from 0 to 1, {part: score}) for how well a Dove ring matches a
+    tower. matched is how the ring was found: 'place', 'word' or 'nearby'.
+    Parts that can't be compared (e.g. no location) score 0.5.
+    """
+
+    ring_type = tower.get_ring_type_display() if tower.ring_type else 'Full-circle ring'
+    miles = distance(tower, here, ring)
+    parts = {
+        'place': {'place': 1, 'word': 0.5}.get(matched, 0),
+        'dedication': dedication_similarity(tower.dedication, ring['dedicn']),
+        'distance': 0.5 if miles is None else max(0.0, 1 - miles / DISTANCE_SCALE),
+        'bells': (0.5 if tower.bells is None or ring['bells'] is None else
+                  (tower.bells == ring['bells']) * 0.5 + (ring_type == ring['ringtype']) * 0.5),
+    }
+    return sum(WEIGHTS[part] * value for part, value in parts.items()), parts
+
+
+def suggest_matches(towers, limit=3, rings=None):
+
+    """
+    For each tower, a list of up to limit (score, parts, ring) Dove
+    candidates, best first. rings, if given, are the Dove rings to match
+    against (dicts of DOVE_COLUMNS); by default all of them.
+    """
+
+    if rings is None:
+        rings = DoveRing.objects.values(*DOVE_COLUMNS)
+    index = BlockingIndex(rings)
+    grids = grid_refs_to_wgs84([tower.os_grid for tower in towers])
+
+    suggestions = []
+    for tower, grid in zip(towers, grids):
+        here = tower_location(tower, grid)
+        scored = []
+        for ringid, matched in index.candidates(tower.place, tower.get_county_display(), here).items():
+            ring = index.rings[ringid]
+            total, parts = score(tower, here, ring, matched)
+            scored.append((total, parts, ring))
+        scored.sort(key=lambda s: (-s[0], s[2]['ringid']))
+        suggestions.append((tower, scored[:limit]))
+    return suggestions
+
+
+def is_confident(scored, threshold=CONFIDENT_SCORE, margin=CONFIDENT_MARGIN):
+    """True if the best of a tower's scored candidates is good enough, and clear enough, to apply"""
+    if not scored or scored[0][0] < threshold:
+        return False
+    return len(scored) == 1 or scored[0][0] - scored[1][0] >= margin
+
+
+@transaction.atomic
+def apply_matches(matches):
+
+    """
+    Set dove_ringid and dove_towerid of each tower in a list of
+    (tower, ring) in one go, with their history. Towers that already have
+    a dove_ringid are left alone, so that one set by hand is never
+    replaced. Returns the number of towers changed.
+    """
+
+    changed = []
+    for tower, ring in matches:
+        if not tower.dove_ringid:
+            tower.dove_ringid, tower.dove_towerid = str(ring['ringid']), str(ring['towerid'])
+            changed.append(tower)
+    if changed:
+        bulk_update_with_history(changed, Tower, ['dove_ringid', 'dove_towerid'],
+                                 default_change_reason='Dove match suggestion')
+        # bulk_update doesn't send post_save
+        record_tower_changes([tower.pk for tower in changed])
+        queue_data_version_bump()
+    return len(changed)
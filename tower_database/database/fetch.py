@@ -0,0 +1,142 @@
+from django.conf import settings
+
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import namedtuple
+import hashlib
+import json
+import requests
+
+from pathlib import Path
+
+# (connect, read) timeouts in seconds
+TIMEOUT = (10, 60)
+
+CHUNK_SIZE = 64 * 1024
+
+MASTER_LIST_URL = 'https://docs.google.com/spreadsheets/d/1o1pAHht9B3VapS9FziLOrMQlSTMvxQ_JeoGSjfEA9hU/gviz/tq'
+MASTER_LIST_PARAMS = {'tqx': 'out:csv', 'sheet': 'Ely DA towers'}
+
+DOVE_URL = 'https://dove.cccbr.org.uk/towers.csv'
+
+# A fetched file, and what to record about it (with commit()) once it has
+# been imported
+Fetched = namedtuple('Fetched', ['path', 'meta_path', 'meta'])
+
+_session = None
+
+
+def get_session():
+
+    """
+    Return a shared requests Session that pools connections and retries
+    failed GETs with back-off.
+    """
+
+    global _session
+    if _session is None:
+        retry = Retry(total=3, backoff_factor=1, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=['GET'])
+        _session = requests.Session()
+        _session.mount('http://', HTTPAdapter(max_retries=retry))
+        _session.mount('https://', HTTPAdapter(max_retries=retry))
+    return _session
+
+
+def fetch(url, params=None, force=False, cache_dir=None, session=None, timeout=TIMEOUT):
+
+    """
+    Download url into the on-disk cache and return a Fetched with the Path
+    of the cached copy, or None if it hasn't changed since the last fetch
+    that was committed (judged by ETag/Last-Modified if the server supports
+    them, otherwise by content hash). With force, always return it.
+
+    Nothing is recorded about the new copy until it is passed to commit(),
+    so if importing it fails the next fetch returns it again.
+
+    The body is streamed to a '.part' file which is only moved into
+    place once complete, so an interrupted download never replaces a good
+    copy and can be resumed with a Range request next time.
+    """
+
+    session = session or get_session()
+    cache_dir = Path(cache_dir or settings.FETCH_CACHE_DIR)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    full_url = requests.Request('GET', url, params=params).prepare().url
+    key = hashlib.sha1(full_url.encode()).hexdigest()
+    data_path = cache_dir / f'{key}.data'
+    meta_path = cache_dir / f'{key}.json'
+    part_path = cache_dir / f'{key}.part'
+    part_meta_path = cache_dir / f'{key}.part.json'
+
+    meta = _read_json(meta_path) if data_path.exists() else {}
+    part_meta = _read_json(part_meta_path) if part_path.exists() else {}
+
+    headers = {}
+    if not force:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+    validator = part_meta.get('etag') or part_meta.get('last_modified')
+    if validator:
+        headers['Range'] = f'bytes={part_path.stat().st_size}-'
+        headers['If-Range'] = validator
+
+    with session.get(full_url, headers=headers, stream=True, timeout=timeout) as r:
+
+        if r.status_code == 304:
+            return None
+        r.raise_for_status()
+
+        validators = {'etag': r.headers.get('ETag'), 'last_modified': r.headers.get('Last-Modified')}
+
+        sha256 = hashlib.sha256()
+        if r.status_code == 206:
+            # Resuming: hash what we already have
+            mode = 'ab'
+            with open(part_path, 'rb') as part:
+                for chunk in iter(lambda: part.read(CHUNK_SIZE), b''):
+                    sha256.update(chunk)
+        else:
+            mode = 'wb'
+            _write_json(part_meta_path, validators)
+
+        with open(part_path, mode) as part:
+            for chunk in r.iter_content(CHUNK_SIZE):
+                part.write(chunk)
+                sha256.update(chunk)
+
+    part_meta_path.unlink(missing_ok=True)
+    changed = force or sha256.hexdigest() != meta.get('sha256')
+
+    fetched = Fetched(data_path, meta_path, {'url': full_url, 'sha256': sha256.hexdigest(), **validators})
+
+    if not changed:
+        # The same as what was last imported, so it is safe to record the
+        # new validators straight away
+        part_path.unlink()
+        commit(fetched)
+        return None
+
+    part_path.replace(data_path)
+    return fetched
+
+
+def commit(fetched):
+    """Record that a Fetched file has been imported, so that fetch() won't return it again until it changes"""
+    _write_json(fetched.meta_path, fetched.meta)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f)
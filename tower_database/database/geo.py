@@ -0,0 +1,146 @@
+from django.db.models import Count, Max, Sum
+
+from collections import defaultdict
+import heapq
+import math
+
+from .models import DoveRing, Tower
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE = EARTH_RADIUS_MILES * math.pi / 180
+
+# Size of a grid cell, in degrees of latitude and longitude (about 7 by 4
+# miles in East Anglia)
+CELL = 0.1
+
+# The points indexed for each kind of object, and a cheap query that
+# changes whenever they might have
+SOURCES = {
+    'tower': (lambda: Tower.objects.filter(lat__isnull=False, lng__isnull=False).values_list('pk', 'lat', 'lng'),
+              lambda: Tower.history.aggregate(v=Max('history_id'))['v']),
+    'dove': (lambda: DoveRing.objects.filter(lat__isnull=False, long__isnull=False).values_list('pk', 'lat', 'long'),
+             lambda: tuple(DoveRing.objects.aggregate(Count('pk'), Max('pk'), Sum('lat'), Sum('long')).values())),
+}
+
+_indexes = {}
+
+
+def haversine(lat1, lng1, lat2, lng2):
+    """Great circle distance in miles"""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+
+def distance_matrix(points):
+    """Miles between every pair of (lat, lng) points, as a list of lists"""
+    return [[haversine(*a, *b) for b in points] for a in points]
+
+
+def cell_of(lat, lng):
+    return (math.floor(lat / CELL), math.floor(lng / CELL))
+
+
+class GridIndex:
+
+    """
+    (pk, lat, lng) points bucketed into a grid of CELL degree squares, so
+    that a query only has to look at the cells near the point it is for
+    """
+
+    def __init__(self, points):
+        self.cells = defaultdict(list)
+        self.size = 0
+        for pk, lat, lng in points:
+            lat, lng = float(lat), float(lng)
+            self.cells[cell_of(lat, lng)].append((pk, lat, lng))
+            self.size += 1
+        if self.cells:
+            rows = [r for r, c in self.cells]
+            cols = [c for r, c in self.cells]
+            self.bounds = (min(rows), max(rows), min(cols), max(cols))
+
+    def within(self, lat, lng, radius):
+
+        """
+        [(distance, pk), ...] for every point within radius miles of
+        (lat, lng), nearest first
+        """
+
+        if not self.size:
+            return []
+        dlat = radius / MILES_PER_DEGREE
+        # Degrees of longitude shrink towards the poles, so size the box
+        # for the most poleward latitude it covers
+        edge = min(89.9, abs(lat) + dlat)
+        dlng = min(180.0, radius / (MILES_PER_DEGREE * math.cos(math.radians(edge))))
+        row0, col0 = cell_of(lat - dlat, lng - dlng)
+        row1, col1 = cell_of(lat + dlat, lng + dlng)
+        row0, row1 = max(row0, self.bounds[0]), min(row1, self.bounds[1])
+        col0, col1 = max(col0, self.bounds[2]), min(col1, self.bounds[3])
+        result = []
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col1 + 1):
+                for pk, plat, plng in self.cells.get((row, col), ()):
+                    distance = haversine(lat, lng, plat, plng)
+                    if distance <= radius:
+                        result.append((distance, pk))
+        result.sort()
+        return result
+
+    def nearest(self, lat, lng, k):
+
+        """
+        [(distance, pk), ...] for the k points nearest (lat, lng), nearest
+        first. Searches rings of cells outwards from the one containing
+        (lat, lng) until nothing further out could be nearer.
+        """
+
+        if not self.size or k < 1:
+            return []
+        row0, col0 = cell_of(lat, lng)
+        rows = max(abs(row0 - self.bounds[0]), abs(row0 - self.bounds[1]))
+        cols = max(abs(col0 - self.bounds[2]), abs(col0 - self.bounds[3]))
+        best = []       # max-heap of the k nearest so far, as (-distance, pk)
+        for ring in range(max(rows, cols) + 1):
+            for row in range(row0 - ring, row0 + ring + 1):
+                step = 1 if ring == 0 or abs(row - row0) == ring else 2 * ring
+                for col in range(col0 - ring, col0 + ring + 1, step):
+                    for pk, plat, plng in self.cells.get((row, col), ()):
+                        item = (-haversine(lat, lng, plat, plng), pk)
+                        if len(best) < k:
+                            heapq.heappush(best, item)
+                        elif item > best[0]:
+                            heapq.heapreplace(best, item)
+            if len(best) == k:
+                # Everything outside this ring is at least this far away
+                edge = min(89.9, abs(lat) + (ring + 1) * CELL)
+                gap = ring * CELL * MILES_PER_DEGREE * math.cos(math.radians(edge))
+                if gap >= -best[0][0]:
+                    break
+        return sorted((-d, pk) for d, pk in best)
+
+
+def get_index(kind):
+
+    """
+    The GridIndex for one kind ('tower' or 'dove'), rebuilt if the
+    underlying table has changed since it was last built
+    """
+
+    points, version = SOURCES[kind]
+    current = version()
+    cached = _indexes.get(kind)
+    if cached is None or cached[0] != current:
+        cached = _indexes[kind] = (current, GridIndex(points()))
+    return cached[1]
+
+
+def nearest(lat, lng, k=10, kind='tower'):
+    """The k objects of kind nearest (lat, lng), as [(miles, pk), ...]"""
+    return get_index(kind).nearest(float(lat), float(lng), k)
+
+
+def within(lat, lng, radius, kind='tower'):
+    """Objects of kind within radius miles of (lat, lng), as [(miles, pk), ...]"""
+    return get_index(kind).within(float(lat), float(lng), radius)
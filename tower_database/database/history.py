@@ -0,0 +1,211 @@
+from django.db import transaction
+from django.utils import timezone
+
+from collections import namedtuple
+import datetime
+
+from .models import Contact, ContactMap, Tower, TowerChange, Website
+
+# How much history to keep for each model:
+#   max_age: versions older than this are dropped, except the one that was
+#       current at the cutoff (None keeps everything)
+#   max_versions: the most versions to keep for any one object (None for
+#       no limit)
+#   burst: successive edits to an object by the same user within this long
+#       of the first of them are collapsed into the last (None to keep
+#       them all)
+Policy = namedtuple('Policy', ['max_age', 'max_versions', 'burst'])
+
+POLICIES = {
+    Tower: Policy(max_age=None, max_versions=None, burst=datetime.timedelta(minutes=30)),
+    Contact: Policy(max_age=datetime.timedelta(days=2 * 365), max_versions=20, burst=datetime.timedelta(minutes=30)),
+    Website: Policy(max_age=datetime.timedelta(days=2 * 365), max_versions=10, burst=datetime.timedelta(minutes=30)),
+    ContactMap: Policy(max_age=datetime.timedelta(days=2 * 365), max_versions=10, burst=datetime.timedelta(minutes=30)),
+}
+
+
+def tracked_fields(model):
+    """The attnames of the fields of model's historical records that hold the object's values"""
+    return [f.attname for f in model.history.model._meta.fields
+            if not f.name.startswith('history_') and f.attname != model._meta.pk.attname]
+
+
+def versions_to_drop(records, fields, policy, now):
+
+    """
+    The history_ids of the records (dicts for one object, oldest first)
+    that policy says should go: changes that changed nothing, all but the
+    last of a burst of edits, and versions beyond the retention limits
+    """
+
+    def same(a, b):
+        return all(a[f] == b[f] for f in fields)
+
+    drop = []
+    kept = []
+    # When the burst of edits ending with each kept record started
+    started = []
+    for record in records:
+        start = record['history_date']
+        if kept and record['history_type'] == '~':
+            previous = kept[-1]
+            if same(previous, record):
+                drop.append(record['history_id'])
+                continue
+            # Measured from the start of the burst, so that steady editing
+            # all day doesn't collapse into one version
+            if (policy.burst is not None and previous['history_type'] == '~'
+                    and previous['history_user_id'] == record['history_user_id']
+                    and record['history_date'] - started[-1] <= policy.burst):
+                drop.append(previous['history_id'])
+                kept.pop()
+                start = started.pop()
+                # The burst may have ended up changing nothing at all
+                if kept and same(kept[-1], record):
+                    drop.append(record['history_id'])
+                    continue
+        kept.append(record)
+        started.append(start)
+
+    if policy.max_versions is not None and len(kept) > policy.max_versions:
+        drop.extend(r['history_id'] for r in kept[:-policy.max_versions])
+        kept = kept[-policy.max_versions:]
+
+    if policy.max_age is not None:
+        cutoff = now - policy.max_age
+        old = [r for r in kept if r['history_date'] < cutoff]
+        # Keep the version current at the cutoff, unless it was a deletion
+        if old and old[-1]['history_type'] != '-':
+            old.pop()
+        drop.extend(r['history_id'] for r in old)
+
+    return drop
+
+
+def compact_history(model, policy=None, batch_size=500, dry_run=False, progress=None):
+
+    """
+    Remove the historical records of model that policy (by default its
+    entry in POLICIES) doesn't keep, batch_size objects at a time, each
+    batch in its own transaction. progress, if given, is called after each
+    batch with (objects done, objects, records removed so far). Returns the
+    number of records removed (or that would be, if dry_run).
+    """
+
+    policy = policy or POLICIES[model]
+    history = model.history.model
+    pk = model._meta.pk.attname
+    fields = tracked_fields(model)
+    columns = [pk, 'history_id', 'history_date', 'history_type', 'history_user_id', *fields]
+    now = timezone.now()
+
+    object_ids = sorted(set(history.objects.values_list(pk, flat=True)))
+    removed = 0
+
+    for start in range(0, len(object_ids), batch_size):
+        batch = object_ids[start:start + batch_size]
+        records = {}
+        for record in history.objects.filter(**{f'{pk}__in': batch}).order_by(pk, 'history_date', 'history_id').values(*columns):
+            records.setdefault(record[pk], []).append(record)
+
+        drop = []
+        for object_records in records.values():
+            drop.extend(versions_to_drop(object_records, fields, policy, now))
+
+        if drop and not dry_run:
+            with transaction.atomic():
+                # Keep well inside SQLite's limit on query parameters
+                for i in range(0, len(drop), 900):
+                    history.objects.filter(history_id__in=drop[i:i + 900]).delete()
+                if model is Tower:
+                    # Later versions' changes are now against different versions
+                    record_tower_changes(batch)
+        removed += len(drop)
+
+        if progress:
+            progress(start + len(batch), len(object_ids), removed)
+
+    return removed
+
+
+def diff_values(previous, record, fields, names):
+
+    """
+    [field name, old value, new value] for each of fields (attnames, with
+    names mapping them to field names) whose value differs between two
+    dicts of historical values. If previous is None (a creation), the
+    fields that have been set.
+    """
+
+    changes = []
+    for field in fields:
+        new = record[field]
+        if previous is None:
+            if new not in (None, '', False) and new != []:
+                changes.append([names[field], None, new])
+        elif previous[field] != new:
+            changes.append([names[field], previous[field], new])
+    return changes
+
+
+def tower_changes(records, fields):
+    """TowerChanges for one tower's historical records (dicts, oldest first)"""
+    names = {f.attname: f.name for f in Tower.history.model._meta.fields}
+    changes = []
+    previous = None
+    for record in records:
+        if record['history_type'] == '-':
+            diff = []
+        else:
+            diff = diff_values(None if record['history_type'] == '+' else previous, record, fields, names)
+        changes.append(TowerChange(history_id=record['history_id'], tower_id=record['id'],
+                                   history_date=record['history_date'], history_type=record['history_type'],
+                                   changes=diff))
+        previous = record
+    return changes
+
+
+def record_tower_changes(tower_ids=None, batch_size=500):
+
+    """
+    Recreate the TowerChanges for the history of the towers with the given
+    ids (which may since have been deleted), or of every tower, batch_size
+    towers at a time. Returns the number of historical records covered.
+    """
+
+    history = Tower.history.model
+    fields = tracked_fields(Tower)
+    columns = ['id', 'history_id', 'history_date', 'history_type', *fields]
+    if tower_ids is None:
+        tower_ids = sorted(set(history.objects.values_list('id', flat=True)))
+    else:
+        tower_ids = list(tower_ids)
+
+    count = 0
+    for start in range(0, len(tower_ids), batch_size):
+        batch = tower_ids[start:start + batch_size]
+        records = {}
+        for record in history.objects.filter(id__in=batch).order_by('id', 'history_date', 'history_id').values(*columns):
+            records.setdefault(record['id'], []).append(record)
+        with transaction.atomic():
+            TowerChange.objects.filter(tower_id__in=batch).delete()
+            changes = [c for tower_records in records.values() for c in tower_changes(tower_records, fields)]
+            TowerChange.objects.bulk_create(changes, batch_size=batch_size)
+        count += len(changes)
+    return count
+
+
+def record_tower_change(history_instance):
+
+    """
+    Create the TowerChange for a historical Tower record that has just been
+    saved, comparing it with the one before as read back from the database
+    (so that e.g. a lat of '52.3863' matches the stored 52.386)
+    """
+
+    fields = tracked_fields(Tower)
+    columns = ['id', 'history_id', 'history_date', 'history_type', *fields]
+    latest = list(Tower.history.model.objects
+                  .filter(id=history_instance.id, history_date__lte=history_instance.history_date)
+                  .order_by('-history_date', '-history_id').values(*columns)[:2])
+    tower_changes(latest[::-1], fields)[-1].save(force_insert=True)
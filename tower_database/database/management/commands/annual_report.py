@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from database.report import FORMATS, generate_report
+from contextlib import nullcontext
+import time
+
+
+class Command(BaseCommand):
+    help = 'Produce the tower listing for the Annual Report'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=FORMATS, default="html", help="Report format (default html)")
+        parser.add_argument("--output", help="Write the report to this file, rather than standard output")
+        parser.add_argument("--stats", action="store_true", help="Report query count, elapsed time and cache use")
+
+
+    def handle(self, *args, **options):
+
+        queries = CaptureQueriesContext(connection) if options['stats'] else nullcontext()
+        with queries:
+            start = time.perf_counter()
+            report, rendered, cached = generate_report(options['format'])
+            elapsed = time.perf_counter() - start
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                f.write(report)
+        else:
+            self.stdout.write(report, ending='')
+
+        if options['stats']:
+            self.stderr.write(f"{len(queries)} queries in {elapsed:.3f}s, {rendered} towers rendered, {cached} from the cache")
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+
+from database.geo import haversine
+from database.models import DoveRing, Tower
+from database.osgrid import grid_refs_to_wgs84
+import time
+
+
+class Command(BaseCommand):
+    help = "Report towers whose OS grid reference, lat/lng and Dove location don't agree"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tolerance", type=float, default=0.25,
+            help="Largest acceptable difference, in miles (default 0.25)")
+        parser.add_argument("--dove", action="store_true", help="Also check the grid reference of every Dove ring against its lat/long")
+        parser.add_argument("--benchmark", action="store_true",
+            help="Time converting every Dove grid reference")
+
+
+    def handle(self, *args, **options):
+
+        if options['benchmark']:
+            return self.benchmark()
+
+        tolerance = options['tolerance']
+        problems = 0
+
+        towers = list(Tower.objects.order_by('place', 'dedication'))
+        dove = DoveRing.objects.in_bulk([int(t.dove_ringid) for t in towers if t.dove_ringid.isdigit()])
+        from_grid = grid_refs_to_wgs84([t.os_grid for t in towers])
+
+        for tower, grid in zip(towers, from_grid):
+            here = (float(tower.lat), float(tower.lng)) if tower.lat is not None and tower.lng is not None else None
+            ring = dove.get(int(tower.dove_ringid)) if tower.dove_ringid.isdigit() else None
+            there = (ring.lat, ring.long) if ring and ring.lat is not None and ring.long is not None else None
+            for check, a, b in (('OS grid v lat/lng', grid, here),
+                                ('lat/lng v Dove', here, there),
+                                ('OS grid v Dove', grid, there)):
+                if a and b and (distance := haversine(*a, *b)) > tolerance:
+                    self.stdout.write(f"{tower}: {check} differ by {distance:.2f} miles")
+                    problems += 1
+
+        if options['dove']:
+            rings = list(DoveRing.objects.exclude(ng='').filter(lat__isnull=False, long__isnull=False).order_by('place'))
+            for ring, grid in zip(rings, grid_refs_to_wgs84([r.ng for r in rings])):
+                if grid and (distance := haversine(*grid, ring.lat, ring.long)) > tolerance:
+                    self.stdout.write(f"Dove {ring.ringid} {ring}: NG v lat/long differ by {distance:.2f} miles")
+                    problems += 1
+
+        self.stdout.write(f"{problems} problem(s) found")
+
+    def benchmark(self):
+
+        refs = list(DoveRing.objects.exclude(ng='').values_list('ng', flat=True))
+        start = time.perf_counter()
+        converted = grid_refs_to_wgs84(refs)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"{sum(1 for c in converted if c)} of {len(refs)} grid references converted in {elapsed * 1000:.1f}ms")
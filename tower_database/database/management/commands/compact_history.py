@@ -0,0 +1,89 @@
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import RequestFactory
+
+from database.history import POLICIES, compact_history
+import statistics
+import time
+
+MODELS = {model.__name__.lower(): model for model in POLICIES}
+
+
+class Command(BaseCommand):
+    help = 'Remove redundant and expired history records (see database/history.py for the policies)'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--model", choices=sorted(MODELS), action="append", help="Only compact this model's history")
+        parser.add_argument("--batch-size", type=int, default=500, help="Objects per batch (default 500)")
+        parser.add_argument("--dry-run", action="store_true", help="Report what would be removed without removing it")
+
+
+    def handle(self, *args, **options):
+
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        for model in [MODELS[m] for m in options['model'] or sorted(MODELS)]:
+
+            name = model.__name__
+            before = self.measure(model)
+            self.stdout.write(f"{name}: {self.describe(before)}")
+
+            def progress(done, total, removed):
+                self.stdout.write(f"{name}: {done}/{total} objects, {removed} records {'to remove' if options['dry_run'] else 'removed'}")
+
+            removed = compact_history(model, batch_size=options['batch_size'], dry_run=options['dry_run'], progress=progress)
+
+            if not options['dry_run'] and removed:
+                self.stdout.write(f"{name}: {self.describe(self.measure(model))}")
+
+    def describe(self, measured):
+        rows, size, latency = measured
+        text = f"{rows} records"
+        if size is not None:
+            text += f", {size / 1024:.0f} KiB"
+        if latency is not None:
+            text += f", history page {latency * 1000:.1f}ms"
+        return text
+
+    def measure(self, model):
+
+        """
+        Number of historical records, the size of the history table and its
+        indexes (SQLite only) and the time to render the admin history page
+        of the object with the most history (if the model has one)
+        """
+
+        history = model.history.model
+        rows = history.objects.count()
+
+        size = None
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                try:
+                    cursor.execute("SELECT SUM(pgsize) FROM dbstat WHERE name IN "
+                                   "(SELECT name FROM sqlite_master WHERE tbl_name = %s)", [history._meta.db_table])
+                    size = cursor.fetchone()[0]
+                except Exception:
+                    # dbstat isn't compiled in
+                    pass
+
+        latency = None
+        model_admin = admin.site._registry.get(model)
+        busiest = (history.objects.values(model._meta.pk.attname).annotate(n=Count('history_id')).order_by('-n').first()
+                   if hasattr(model_admin, 'history_view') else None)
+        if busiest:
+            request = RequestFactory().get('/')
+            # An unsaved superuser, so that nothing is written to the database
+            request.user = get_user_model()(is_superuser=True, is_active=True, is_staff=True)
+            timings = []
+            for n in range(5):
+                start = time.perf_counter()
+                model_admin.history_view(request, str(busiest[model._meta.pk.attname]))
+                timings.append(time.perf_counter() - start)
+            latency = statistics.median(timings)
+
+        return rows, size, latency
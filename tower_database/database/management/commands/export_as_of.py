@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from database.snapshot import TABLES, export_csv, export_json, parse_when
+from contextlib import nullcontext
+import sys
+import time
+
+
+class Command(BaseCommand):
+    help = 'Export towers, contacts and websites as they were at a given date and time, from their history'
+
+    def add_arguments(self, parser):
+        parser.add_argument("when", help="YYYY-MM-DD (meaning the end of that day) or YYYY-MM-DD HH:MM[:SS]")
+        parser.add_argument("--format", choices=["json", "csv"], default="json", help="Export format (default json)")
+        parser.add_argument("--table", choices=list(TABLES), action="append",
+            help="Only export this table (CSV exports exactly one, by default towers)")
+        parser.add_argument("--output", help="Write the export to this file, rather than standard output")
+        parser.add_argument("--stats", action="store_true", help="Report query count and elapsed time")
+
+
+    def handle(self, *args, **options):
+
+        when = parse_when(options['when'])
+        if when is None:
+            raise CommandError(f"Can't understand '{options['when']}' as a date or date and time")
+
+        if options['format'] == 'csv':
+            tables = options['table'] or ['towers']
+            if len(tables) > 1:
+                raise CommandError("A CSV export can only contain one table")
+            chunks = export_csv(when, tables[0])
+        else:
+            chunks = export_json(when, options['table'])
+
+        out = open(options['output'], 'w', newline='') if options['output'] else sys.stdout
+        try:
+            queries = CaptureQueriesContext(connection) if options['stats'] else nullcontext()
+            with queries:
+                start = time.perf_counter()
+                for chunk in chunks:
+                    out.write(chunk)
+                elapsed = time.perf_counter() - start
+        finally:
+            if options['output']:
+                out.close()
+
+        if options['stats']:
+            self.stderr.write(f"{len(queries)} queries in {elapsed:.3f}s")
@@ -0,0 +1,107 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from database.dove import rebuild_dove_rings
+from database.fetch import commit, fetch, DOVE_URL
+from database.models import DoveTower
+from database.search import index_objects
+import csv
+import time
+
+from itertools import islice
+
+
+class Command(BaseCommand):
+    help = 'Load the copy of Dove (dove_towers and its typed copy) from a Dove CSV download'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", help="Load from this Dove CSV file, rather than downloading from Dove")
+        parser.add_argument("--force", action="store_true", help="Load even if Dove hasn't changed since the last download")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Rows per INSERT batch (default 1000)")
+        parser.add_argument("--benchmark", action="store_true", help="Report load time and rows per second")
+
+
+    def handle(self, *args, **options):
+
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        path = options['file']
+        fetched = None
+        if not path:
+            fetched = fetch(DOVE_URL, force=options['force'])
+            if fetched is None:
+                self.stdout.write("Dove unchanged since last download (use --force to load anyway)")
+                return
+            path = fetched.path
+
+        start = time.perf_counter()
+
+        # 'utf-8-sig' strips the BOM that Dove puts in front of 'TowerID'
+        with open(path, newline='', encoding='utf-8-sig') as dove_csv, transaction.atomic():
+            rows = load_dove_csv(dove_csv, options['batch_size'])
+            loaded = time.perf_counter()
+            rebuild_dove_rings()
+            converted = time.perf_counter()
+            index_objects('dove')
+
+        elapsed = time.perf_counter() - start
+
+        # Only now, so that a failed load is tried again next time
+        if fetched:
+            commit(fetched)
+
+        self.stdout.write(f"Loaded {rows} Dove rings")
+        if options['benchmark']:
+            self.stdout.write(f"Load:    {loaded - start:.3f}s, {rows / (loaded - start):.0f} rows/sec")
+            self.stdout.write(f"Convert: {converted - loaded:.3f}s")
+            self.stdout.write(f"Index:   {time.perf_counter() - converted:.3f}s")
+
+
+def load_dove_csv(dove_csv, batch_size=1000):
+
+    """
+    Load the rows of an open Dove CSV file into a fresh copy of the Dove
+    table and then swap it for the existing one, all in one transaction so
+    nobody ever sees a partly-loaded table. Returns the number of rows loaded.
+    """
+
+    table = DoveTower._meta.db_table
+    new_table = f'{table}_new'
+    columns = [f.column for f in DoveTower._meta.fields]
+    qn = connection.ops.quote_name
+
+    reader = csv.reader(dove_csv)
+    try:
+        header = next(reader)
+    except StopIteration:
+        raise CommandError("Dove CSV file is empty")
+
+    missing = set(columns) - set(header)
+    if missing:
+        raise CommandError(f"Dove CSV is missing column(s): {', '.join(sorted(missing))}")
+
+    # Position of each of our columns in the CSV (which may have others)
+    positions = [header.index(c) for c in columns]
+
+    column_defs = ', '.join(f'{qn(c)} TEXT' + (' PRIMARY KEY' if c == DoveTower._meta.pk.column else '') for c in columns)
+    insert = (f'INSERT INTO {qn(new_table)} ({", ".join(qn(c) for c in columns)}) '
+              f'VALUES ({", ".join(["%s"] * len(columns))})')
+
+    rows = 0
+    with transaction.atomic(), connection.cursor() as cursor:
+
+        cursor.execute(f'DROP TABLE IF EXISTS {qn(new_table)}')
+        cursor.execute(f'CREATE TABLE {qn(new_table)} ({column_defs})')
+
+        while True:
+            batch = [[row[p] for p in positions] for row in islice(reader, batch_size)]
+            if not batch:
+                break
+            cursor.executemany(insert, batch)
+            rows += len(batch)
+
+        cursor.execute(f'DROP TABLE IF EXISTS {qn(table)}')
+        cursor.execute(f'ALTER TABLE {qn(new_table)} RENAME TO {qn(table)}')
+
+    return rows
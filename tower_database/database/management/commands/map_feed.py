@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from database.mapfeed import MAX_ZOOM, POINTS, geojson, get_cluster_index, kml
+import time
+
+
+class Command(BaseCommand):
+    help = 'Write the towers (or Dove rings) as GeoJSON or KML, optionally clustered for a zoom level'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kind", choices=sorted(POINTS), default="tower", help="What to map (default tower)")
+        parser.add_argument("--format", choices=["geojson", "kml"], default="geojson", help="Output format (default geojson)")
+        parser.add_argument("--zoom", type=int, default=MAX_ZOOM + 1, help=f"Cluster as at this zoom level (default {MAX_ZOOM + 1}, no clustering)")
+        parser.add_argument("--bbox", help="Only include this area, as west,south,east,north")
+        parser.add_argument("--output", help="Write to this file, rather than standard output")
+        parser.add_argument("--stats", action="store_true", help="Report the number of features at each zoom level and build time")
+
+
+    def handle(self, *args, **options):
+
+        bbox = None
+        if options['bbox']:
+            try:
+                bbox = [float(v) for v in options['bbox'].split(',')]
+            except ValueError:
+                bbox = []
+            if len(bbox) != 4:
+                raise CommandError("--bbox must be west,south,east,north")
+
+        start = time.perf_counter()
+        index = get_cluster_index(options['kind'])
+        elapsed = time.perf_counter() - start
+
+        features = index.features(options['zoom'], bbox)
+        if options['format'] == 'kml':
+            text = kml(features, 'Dove towers' if options['kind'] == 'dove' else 'Towers')
+        else:
+            text = geojson(features) + '\n'
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(text)
+        else:
+            self.stdout.write(text, ending='')
+
+        if options['stats']:
+            self.stderr.write(f"Built in {elapsed:.3f}s; features by zoom: "
+                              + ', '.join(f"{zoom}: {len(index.features(zoom, bbox))}" for zoom in range(MAX_ZOOM + 2)))
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from database.geo import SOURCES, get_index, haversine
+from database.models import DoveRing, Tower
+import random
+import time
+
+MODELS = {'tower': Tower, 'dove': DoveRing}
+
+
+class Command(BaseCommand):
+    help = 'List the towers (or Dove rings) nearest a point, or within a distance of it'
+
+    def add_arguments(self, parser):
+        parser.add_argument("lat", type=float, nargs="?")
+        parser.add_argument("lng", type=float, nargs="?")
+        parser.add_argument("--kind", choices=sorted(SOURCES), default="tower", help="What to search (default tower)")
+        parser.add_argument("-k", type=int, default=10, help="How many to list (default 10)")
+        parser.add_argument("--within", type=float, metavar="MILES", help="List everything within this many miles instead")
+        parser.add_argument("--benchmark", type=int, metavar="QUERIES",
+            help="Time this many random queries against brute-force haversine over every row, and check they agree")
+
+
+    def handle(self, *args, **options):
+
+        if options['benchmark']:
+            return self.benchmark(options['kind'], options['benchmark'], options['k'], options['within'] or 10)
+
+        if options['lat'] is None or options['lng'] is None:
+            raise CommandError("Give a latitude and longitude (or --benchmark)")
+        if options['k'] < 1:
+            raise CommandError("-k must be at least 1")
+
+        index = get_index(options['kind'])
+        if options['within'] is not None:
+            found = index.within(options['lat'], options['lng'], options['within'])
+        else:
+            found = index.nearest(options['lat'], options['lng'], options['k'])
+
+        objects = MODELS[options['kind']].objects.in_bulk([pk for d, pk in found])
+        for distance, pk in found:
+            self.stdout.write(f"{distance:6.2f} miles  {objects[pk]}")
+
+    def benchmark(self, kind, queries, k, radius):
+
+        start = time.perf_counter()
+        index = get_index(kind)
+        built = time.perf_counter() - start
+        points = [(pk, float(lat), float(lng)) for cell in index.cells.values() for pk, lat, lng in cell]
+        self.stdout.write(f"{kind}: {len(points)} points, index built in {built * 1000:.1f}ms")
+
+        # Query points near real ones, so that there is something to find
+        rng = random.Random(0)
+        targets = [(lat + rng.uniform(-0.2, 0.2), lng + rng.uniform(-0.2, 0.2)) for pk, lat, lng in rng.choices(points, k=queries)]
+
+        def brute_nearest(lat, lng):
+            return sorted((haversine(lat, lng, plat, plng), pk) for pk, plat, plng in points)[:k]
+
+        def brute_within(lat, lng):
+            return sorted(d for d in ((haversine(lat, lng, plat, plng), pk) for pk, plat, plng in points) if d[0] <= radius)
+
+        for name, fast, slow in ((f"nearest k={k}", lambda lat, lng: index.nearest(lat, lng, k), brute_nearest),
+                                 (f"within {radius:g} miles", lambda lat, lng: index.within(lat, lng, radius), brute_within)):
+            timings = []
+            results = []
+            for function in (fast, slow):
+                start = time.perf_counter()
+                results.append([function(lat, lng) for lat, lng in targets])
+                timings.append((time.perf_counter() - start) / queries)
+            # Compare distances, as equidistant points may come in either order
+            mismatches = sum([d for d, pk in a] != [d for d, pk in b] for a, b in zip(*results))
+            self.stdout.write(f"{name:>18}: grid {timings[0] * 1000:7.3f}ms  brute force {timings[1] * 1000:7.3f}ms  "
+                              f"x{timings[1] / timings[0]:.0f}, {mismatches} mismatches")
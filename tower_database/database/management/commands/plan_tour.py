@@ -0,0 +1,59 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from database.models import Tower
+from database.tours import plan_tour
+import time
+
+
+class Command(BaseCommand):
+    help = 'Order a set of towers to keep the distance travelled between them short'
+
+    def add_arguments(self, parser):
+        parser.add_argument("towers", type=int, nargs="*", help="IDs of the towers to visit (default: all that match the filters)")
+        parser.add_argument("--district", choices=Tower.Districts.values, action="append", help="Only towers in this district")
+        parser.add_argument("--status", choices=Tower.RingingStatus.values, action="append", help="Only towers with this ringing status")
+        parser.add_argument("--bells", type=int, help="Only towers with at least this many bells")
+        parser.add_argument("--start", type=int, help="ID of the tower to start from (default: the first listed, or the first alphabetically)")
+        parser.add_argument("--return", dest="closed", action="store_true", help="Finish back at the start")
+        parser.add_argument("--time-limit", type=float, default=2.0, help="Seconds to spend improving the route (default 2)")
+
+
+    def handle(self, *args, **options):
+
+        towers = Tower.objects.filter(lat__isnull=False, lng__isnull=False).order_by('place', 'dedication')
+        if options['towers']:
+            towers = towers.filter(pk__in=options['towers'])
+        if options['district']:
+            towers = towers.filter(district__in=options['district'])
+        if options['status']:
+            towers = towers.filter(ringing_status__in=options['status'])
+        if options['bells'] is not None:
+            towers = towers.filter(bells__gte=options['bells'])
+        towers = list(towers)
+
+        if options['towers']:
+            missing = set(options['towers']) - {t.pk for t in towers}
+            if missing:
+                raise CommandError(f"Unknown tower(s), or tower(s) without a location: {', '.join(map(str, sorted(missing)))}")
+            # Keep the order given, so that the first listed is the default start
+            order = {pk: n for n, pk in enumerate(options['towers'])}
+            towers.sort(key=lambda t: order[t.pk])
+        if not towers:
+            raise CommandError("No towers to visit")
+
+        start = 0
+        if options['start'] is not None:
+            start = next((n for n, t in enumerate(towers) if t.pk == options['start']), None)
+            if start is None:
+                raise CommandError(f"Start tower {options['start']} isn't one of the towers to visit")
+
+        began = time.perf_counter()
+        route, legs, finished = plan_tour([(float(t.lat), float(t.lng)) for t in towers], start,
+                                          options['closed'], options['time_limit'])
+        elapsed = time.perf_counter() - began
+
+        self.stdout.write(f"{'':>7}  {towers[route[0]]}")
+        for leg, n in zip(legs, route[1:] + route[:1] if options['closed'] else route[1:]):
+            self.stdout.write(f"{leg:6.1f}m  {towers[n]}")
+        self.stdout.write(f"{len(towers)} towers, {sum(legs):.1f} miles, planned in {elapsed:.2f}s"
+                          + ("" if finished else " (stopped at the time limit)"))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from database.calendar import rebuild_practice_slots
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the practice slots table from every tower'
+
+    def handle(self, *args, **options):
+        self.stdout.write(f"{rebuild_practice_slots()} practice slots created")
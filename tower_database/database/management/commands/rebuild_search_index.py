@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from database.models import DoveRing
+from database.search import SOURCES, fold, index_objects, use_fts5
+import time
+
+# Typical search-as-you-type terms
+BENCHMARK_TERMS = ['ca', 'cambr', 'st m', 'mary magd', 'holy trin', 'zzz']
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the admin search index for towers and/or Dove'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kind", choices=sorted(SOURCES), action="append", help="Only rebuild this index")
+        parser.add_argument("--benchmark", action="store_true",
+            help="Compare search latency against icontains as the Dove table grows (SQLite with FTS5 only)")
+
+
+    def handle(self, *args, **options):
+
+        for kind in options['kind'] or sorted(SOURCES):
+            start = time.perf_counter()
+            count = index_objects(kind)
+            self.stdout.write(f"{kind}: {count} indexed in {time.perf_counter() - start:.3f}s "
+                              f"({'FTS5' if use_fts5() else 'word table'})")
+
+        if options['benchmark']:
+            if not use_fts5():
+                raise CommandError("--benchmark needs SQLite with FTS5")
+            self.benchmark()
+
+    def benchmark(self):
+
+        """
+        Copy the Dove search text into temporary tables 1, 4 and 16 times
+        over and time search-as-you-type (first 10 matches) for each term,
+        using FTS5 and using the LIKE '%...%' on each search field that
+        icontains produces
+        """
+
+        model, fields, text = SOURCES['dove']
+        values = list(DoveRing.objects.values(*fields))
+
+        with connection.cursor() as cursor:
+            for copies in (1, 4, 16):
+                cursor.execute("DROP TABLE IF EXISTS temp.bench_fts")
+                cursor.execute("DROP TABLE IF EXISTS temp.bench_plain")
+                cursor.execute("CREATE VIRTUAL TABLE temp.bench_fts USING fts5(text, prefix='1 2 3')")
+                cursor.execute("CREATE TEMP TABLE bench_plain (place TEXT, dedicn TEXT, towerid TEXT, ringid TEXT)")
+                rows = values * copies
+                cursor.executemany("INSERT INTO temp.bench_fts (text) VALUES (%s)", [(' '.join(fold(text(v))),) for v in rows])
+                cursor.executemany("INSERT INTO bench_plain VALUES (%s, %s, %s, %s)",
+                                   [(v['place'], v['dedicn'], str(v['towerid']), str(v['ringid'])) for v in rows])
+
+                self.stdout.write(f"{len(rows)} rows (FTS5 / icontains, ms):")
+                for term in BENCHMARK_TERMS:
+                    query = ' '.join(f'"{word}"*' for word in fold(term))
+                    start = time.perf_counter()
+                    cursor.execute("SELECT rowid FROM temp.bench_fts WHERE bench_fts MATCH %s LIMIT 10", [query])
+                    cursor.fetchall()
+                    fts_time = time.perf_counter() - start
+
+                    start = time.perf_counter()
+                    cursor.execute("SELECT rowid FROM bench_plain WHERE place LIKE %s OR dedicn LIKE %s OR towerid LIKE %s OR ringid LIKE %s LIMIT 10",
+                                   [f'%{term}%'] * 4)
+                    cursor.fetchall()
+                    like_time = time.perf_counter() - start
+
+                    self.stdout.write(f"    {term!r:>14}: {1000 * fts_time:6.2f} / {1000 * like_time:6.2f}")
+
+            cursor.execute("DROP TABLE temp.bench_fts")
+            cursor.execute("DROP TABLE temp.bench_plain")
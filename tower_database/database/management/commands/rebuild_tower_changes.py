@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from database.history import record_tower_changes
+import time
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the precomputed changes for every historical tower record'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Towers per batch (default 500)")
+
+
+    def handle(self, *args, **options):
+
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        start = time.perf_counter()
+        count = record_tower_changes(batch_size=options['batch_size'])
+        self.stdout.write(f"{count} historical records diffed in {time.perf_counter() - start:.3f}s")
@@ -1,10 +1,12 @@
 from django.core.management.base import BaseCommand, CommandError
 
-from database.models import Tower, Contact, DoveTower
-import re
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
-from unidecode import unidecode
-from urllib.parse import urlparse
+from database.models import Tower, DoveTower, ReconcileIssue
+from database.reconcile import DOVE_COLUMNS, LABELS, check, describe, reconcile
+from contextlib import nullcontext
+import time
 
 class Command(BaseCommand):
     help = 'Compare the database against the copy of Dove'
@@ -12,8 +14,11 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
 
         parser.add_argument("--all-names", action="store_true", help="Print all tower names")
-        parser.add_argument("--omit", action="append", metavar='TEST', help="Omit this test")
-        parser.add_argument("--only", action="append", metavar='TEST', help="Only perform this test")
+        parser.add_argument("--omit", action="append", metavar='TEST', help="Omit this test (results aren't saved)")
+        parser.add_argument("--only", action="append", metavar='TEST', help="Only perform this test (results aren't saved)")
+        parser.add_argument("--per-tower", action="store_true", help="Look up each Dove tower with its own query, rather than in bulk")
+        parser.add_argument("--full", action="store_true", help="Check every tower, not just those that have changed, or whose Dove entry has, since they were last checked")
+        parser.add_argument("--stats", action="store_true", help="Report query count and elapsed time")
 
 
     def handle(self, *args, **options):
@@ -22,128 +27,50 @@ class Command(BaseCommand):
         def do_this(test):
             return not ( (options["omit"] and test in options["omit"]) or (options["only"] and test not in options["only"]) )
 
-        def is_eq(eda, dove):
-            return str(eda) == str(dove)
+        # Only a full set of results is saved
+        save = not (options["omit"] or options["only"])
 
-        def is_county_eq(eda, dove):
-            return eda == dove[0]
+        queries = CaptureQueriesContext(connection) if options["stats"] else nullcontext()
+        with queries:
 
-        def is_dedication_eq(eda, dove):
+            start = time.perf_counter()
 
-            # Convert to Dove style
+            towers = list(Tower.objects.all())
 
-            eda = unidecode(eda)
-
-            eda_subs = (
-
-                (r'\bthe Great\b',                  'Gt'),
-                (r'\bMary Magdalene\b',             'Mary Magd'),
-                (r'\bMary the Virgin\b',            'Mary V'),
-                (r'\bMary the Blessed Virgin\b',    'Mary BV'),
-                (r'\bthe Baptist\b',                'Bapt'),
-                (r'\bthe Evangelist\b',             'Ev'),
-                (r'\bof the Blessed Virgin Mary\b', 'of BVM'),
-                (r' and the Holy Host of Heaven\b', ''),
-                (r'\bCathedral Church\b',           'Cath Ch'),
-                (r'\bthe English Martyrs\b',        'Eng Martyrs'),
-                (r'\bKing and Martyr\b',            'K&M'),
-                (r'\bof the Holy and Undivided\b',  'of Holy and Undivided'),
-                (r'^The ',                          ''),
-                (r'\bSt\b',                         'S'),
-                (r'\band\b',                        '&'),
-
-            )
-
-            for sub in eda_subs:
-                pattern, replacement = sub
-                eda = re.sub(pattern, replacement, eda)
-
-            #print(f"'{eda}' '{dove}'")
-
-            return eda == dove
-
-        def is_status_believable(eda, dove):
-            if dove != '':
-                return eda == 'N'
-            return True
-
-        def is_type_eq(eda, dove):
-
-            if eda == '' and dove == 'Full-circle ring':
-                return True
-            return eda == dove
-
-        def is_bool_eq(eda, dove):
-            return (dove != '')  == eda
-
-        def web_page_eq(eda, dove):
-            eda_parsed = urlparse(eda)
-            dove_parsed = urlparse(dove)
-            if eda_parsed.hostname == 'dove.cccbr.org.uk':
-                return True
-            return (eda_parsed.netloc == dove_parsed.netloc and
-                    eda_parsed.path == dove_parsed.path and
-                    eda_parsed.query == dove_parsed.query)
-
-        tests = (
-            ( 'TowerID', 'dove_towerid', 'towerid', is_eq ),
-            ( 'Place', 'place', 'place', is_eq ),
-            ( 'County', 'county', 'county', is_county_eq ),
-            ( 'Dedication', 'dedication', 'dedicn', is_dedication_eq ),
-            ( 'Status', 'ringing_status', 'ur', is_status_believable),
-            ( 'Bells', 'bells', 'bells', is_eq ),
-            ( 'Type', 'ring_type', 'ringtype', is_type_eq ),
-            # Weight
-            #( 'Note', 'eda.Note', 'dove.Note', is_eq ),
-            ( 'GF' , 'gf', 'gf', is_bool_eq ),
-            ( 'OSGrid', 'os_grid', 'ng', is_eq ),
-            ( 'Postcode', 'postcode', 'postcode', is_eq ),
-            # LAt
-            # Lng
-            #( 'Website', 'eda.Website', 'dove.WebPage', web_page_eq ),
-            ( 'TowerbaseID', 'towerbase_id', 'towerbase', is_eq )
-            )
-
-
-
-
-        for tower in Tower.objects.all():
-
-            errors = []
-
-            try:
-                dove_tower = DoveTower.objects.get(ringid=tower.dove_ringid)
-            except DoveTower.DoesNotExist:
-                errors.append(f"[RingID] '{dove.ring_id}' not found")
+            if options["per_tower"]:
+                def get_dove(ringid):
+                    try:
+                        return DoveTower.objects.only(*DOVE_COLUMNS).get(ringid=ringid)
+                    except DoveTower.DoesNotExist:
+                        return None
             else:
+                # Fetch all the Dove rows we need in one go
+                ringids = {tower.dove_ringid for tower in towers if tower.dove_ringid}
+                dove_towers = {dove.ringid: dove for dove in DoveTower.objects.only(*DOVE_COLUMNS).filter(ringid__in=ringids)}
+                get_dove = dove_towers.get
+
+            if save:
+                checked = reconcile(towers, get_dove, full=options["full"])
+                found = {}
+                for issue in ReconcileIssue.objects.filter(resolved_at__isnull=True).order_by():
+                    found.setdefault(issue.tower_id, []).append((issue.test, issue.ours, issue.theirs))
+            else:
+                checked = len(towers)
+                found = {tower.pk: check(tower, get_dove(tower.dove_ringid), do_this) for tower in towers}
 
-                for t in tests:
-                    (label, us, them, fn) = t
-                    if do_this(label):
-                      if not fn(getattr(tower,us), getattr(dove_tower,them)):
-                        errors.append(f"[{label}] us: '{getattr(tower, us)}', them: '{getattr(dove_tower, them)}'")
-
-                if do_this('Diocese'):
-                    if 'Ely' not in dove_tower.diocese.split(';'):
-                        errors.append(f"[Diocese] 'Ely' not fonud in Dove Diocese '{dove_tower.diocese}'")
-
-                # Dove normally only list Affiliation for Bells >= 4 and it only matters for
-                # Full-circle rings
-                if do_this('Affiliation'):
-                    if (int(dove_tower.bells) >= 4 and
-                        dove_tower.ringtype == 'Full-circle ring' and
-                        'Ely Diocesan Association' not in dove_tower.affiliations.split(';')):
-                        errors.append(f"[Affiliation] 'Ely Diocesan Association' not found in Dove Affiliations :'{dove_tower.affiliations}'")
-
-
-
+            for tower in towers:
+                self.print_tower(tower, sorted(found.get(tower.pk, []), key=lambda f: LABELS.index(f[0])), options)
 
+            elapsed = time.perf_counter() - start
 
+        if options["stats"]:
+            mode = 'per-tower' if options["per_tower"] else 'bulk'
+            self.stdout.write(f"\n{checked} of {len(towers)} towers checked ({mode}): {len(queries)} queries in {elapsed:.3f}s")
 
-            if errors or options["all_names"]:
-                self.stdout.write(f"\n{tower.place} {tower.dedication}:")
+    def print_tower(self, tower, findings, options):
 
-            if errors:
-                for error in errors:
-                    self.stdout.write(f"    {error}")
+        if findings or options["all_names"]:
+            self.stdout.write(f"\n{tower.place} {tower.dedication}:")
 
+        for finding in findings:
+            self.stdout.write(f"    {describe(*finding)}")
@@ -1,11 +1,21 @@
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.test.utils import CaptureQueriesContext
 
-from database.models import Tower, Contact, ContactMap
-import requests
+from database.api import queue_data_version_bump
+from database.calendar import rebuild_practice_slots
+from database.fetch import commit, fetch, MASTER_LIST_URL, MASTER_LIST_PARAMS
+from database.history import record_tower_changes
+from database.models import Tower, Contact, ContactMap, Website
+from database.search import index_objects
+from database.signals import row_updates_suspended
+from simple_history.utils import bulk_create_with_history
+from contextlib import nullcontext
 import csv
 import re
+import time
 
-from io import StringIO
+from decimal import Decimal
 
 easy_fields = (
     ('Place', 'place'),
@@ -19,8 +29,8 @@ easy_fields = (
     ('Note', 'note'),
     ('OS grid', 'os_grid'),
     ('Postcode', 'postcode'),
-    ('Lng', 'lat'),
-    ('Lat', 'lng'),
+    ('Lat', 'lat'),
+    ('Lng', 'lng'),
     ('Dove Tower ID', 'dove_towerid'),
     ('Dove Ring ID', 'dove_ringid'),
     ('TowerBase ID', 'towerbase_id'),
@@ -49,70 +59,235 @@ lookup_fields = (
     ))
 
 
+def parse_row(csv_row):
+
+    """
+    Convert a row of the master list into a dict of Tower field values,
+    the (name, phone, email) of its primary contact (or None) and its
+    website (or '')
+    """
+
+    # Start from the defaults so that blank cells reset fields
+    values = {t: Tower._meta.get_field(t).get_default() for f, t, l in lookup_fields}
+
+    for f, t in easy_fields:
+        values[t] = csv_row[f]
+
+    for f, t in boolean_fields:
+        values[t] = csv_row[f] == "Yes"
+
+    for f, t, l in lookup_fields:
+        if csv_row[f]:
+            values[t] = l[csv_row[f]]
+
+    values['practice_weeks'] = re.split(r', +', csv_row['Week'])
+
+    values['bells'] = int(csv_row['Bells'])
+    values['peals'] = int(csv_row['Peals']) if csv_row['Peals'] else None
+
+    if csv_row['Band contact'] and csv_row['Bells contact']:
+        values['contact_use'] = 'All'
+    elif csv_row['Band contact']:
+        values['contact_use'] = 'Band only'
+    elif csv_row['Bells contact']:
+        values['contact_use'] = 'Bells only'
+    else:
+        values['contact_use'] = 'None'
+
+    contact = None
+    if csv_row['Secretary'] or csv_row['Phone'] or csv_row['Email']:
+        contact = (csv_row['Secretary'], csv_row['Phone'], csv_row['Email'])
+
+    return values, contact, csv_row['Website']
+
+
 class Command(BaseCommand):
     help = 'Reload the database from the master list'
 
     def add_arguments(self, parser):
         parser.add_argument("--file", help="Import from CSV, rather than collecting directly")
+        parser.add_argument("--force", action="store_true", help="Reload even if the master list hasn't changed")
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument("--incremental", action="store_true",
+            help="Only create, update or delete towers that have changed (matched on Dove RingID)")
+        mode.add_argument("--bulk", action="store_true", help="Recreate everything using bulk inserts")
+        parser.add_argument("--stats", action="store_true", help="Report query count and elapsed time")
 
 
     def handle(self, *args, **options):
 
-        # Clear out all the old stuff
-        Tower.objects.all().delete()
-        Contact.objects.all().delete()
-
+        fetched = None
         if options['file']:
             # REad from the supplied file
             tower_csv = open(options['file'], newline='')
         else:
-            # Get the CSV data from the master list
-            spreadsheet = '1o1pAHht9B3VapS9FziLOrMQlSTMvxQ_JeoGSjfEA9hU'
-            sheet = 'Ely DA towers'
-            url = f"https://docs.google.com/spreadsheets/d/{spreadsheet}/gviz/tq"
-            payload = {'tqx': 'out:csv', 'sheet': sheet}
-            r = requests.get(url, payload)
-            tower_csv = StringIO(r.text)
+            # Get the CSV data from the master list, unless it hasn't changed
+            fetched = fetch(MASTER_LIST_URL, MASTER_LIST_PARAMS, force=options['force'])
+            if fetched is None:
+                self.stdout.write("Master list unchanged since last reload (use --force to reload anyway)")
+                return
+            tower_csv = open(fetched.path, newline='', encoding='utf-8')
+
+        # Only count queries when asked to, as it keeps every one in memory
+        queries = CaptureQueriesContext(connection) if options['stats'] else nullcontext()
+        with queries:
+
+            start = time.perf_counter()
+
+            if options['incremental']:
+                self.reload_incremental(csv.DictReader(tower_csv))
+            elif options['bulk']:
+                self.reload_bulk(csv.DictReader(tower_csv))
+            else:
+                self.reload_all(csv.DictReader(tower_csv))
+
+            elapsed = time.perf_counter() - start
+
+        # Only now, so that a failed reload is tried again next time
+        if fetched:
+            commit(fetched)
+
+        if options['stats']:
+            self.stdout.write(f"{len(queries)} queries in {elapsed:.3f}s")
+
+    @transaction.atomic
+    def reload_all(self, rows):
 
-        for csv_row in csv.DictReader(tower_csv):
+        old = list(Tower.objects.values_list('pk', flat=True))
 
-            self.stdout.write(csv_row['Place'])
+        with row_updates_suspended():
 
-            db_row = Tower()
+            # Clear out all the old stuff
+            Tower.objects.all().delete()
+            Contact.objects.all().delete()
 
-            for f, t in easy_fields:
-                setattr(db_row, t, csv_row[f])
+            new = []
+            for csv_row in rows:
 
-            for f, t in boolean_fields:
-                setattr(db_row, t, csv_row[f] == "Yes")
+                self.stdout.write(csv_row['Place'])
 
-            for f, t, l in lookup_fields:
-                if csv_row[f]:
-                    setattr(db_row, t, l[csv_row[f]])
+                values, contact, website = parse_row(csv_row)
 
-            weeks = re.split(r', +', csv_row['Week'])
-            db_row.practice_weeks = weeks
+                db_row = Tower(**values)
 
-            db_row.bells = int(csv_row['Bells'])
-            if csv_row['Peals']:
-                db_row.peals = int(csv_row['Peals'])
+                if contact:
+                    (db_row.primary_contact, created) = Contact.objects.get_or_create(name=contact[0], phone=contact[1], email=contact[2])
 
-            if csv_row['Secretary'] or csv_row['Phone'] or csv_row['Email']:
-                (contact, created) = Contact.objects.get_or_create(name=csv_row['Secretary'], phone=csv_row['Phone'], email=csv_row['Email'])
-                db_row.primary_contact = contact
+                db_row.save()
+                new.append(db_row.pk)
 
-            contact_use = ''
-            if csv_row['Band contact'] and csv_row['Bells contact']:
-                db_row.contact_use = 'All'
-            elif csv_row['Band contact']:
-                db_row.contact_use = 'Band only'
-            elif csv_row['Bells contact']:
-                db_row.contact_use = 'Bells only'
+                if website:
+                    db_row.website_set.create(website=website)
+
+        self.rebuild(old + new)
+
+    @transaction.atomic
+    def reload_bulk(self, rows):
+
+        parsed = [parse_row(csv_row) for csv_row in rows]
+        old = list(Tower.objects.values_list('pk', flat=True))
+
+        # Clear out all the old stuff, without updating what is derived
+        # from each tower as it goes
+        with row_updates_suspended():
+            Tower.objects.all().delete()
+            Contact.objects.all().delete()
+
+        # One Contact for each distinct (name, phone, email)
+        contacts = {}
+        for values, contact, website in parsed:
+            if contact and contact not in contacts:
+                contacts[contact] = Contact(name=contact[0], phone=contact[1], email=contact[2])
+        bulk_create_with_history(list(contacts.values()), Contact)
+
+        towers = [Tower(**values, primary_contact=contacts.get(contact)) for values, contact, website in parsed]
+        bulk_create_with_history(towers, Tower)
+
+        websites = [Website(tower=tower, website=website) for tower, (values, contact, website) in zip(towers, parsed) if website]
+        bulk_create_with_history(websites, Website)
+
+        # bulk_create doesn't send post_save
+        self.rebuild(old + [tower.pk for tower in towers])
+
+        self.stdout.write(f"{len(towers)} towers, {len(contacts)} contacts, {len(websites)} websites created")
+
+    def rebuild(self, tower_ids):
+        # Everything derived from the towers, all at once, for the towers
+        # (new and deleted) with the given ids
+        rebuild_practice_slots()
+        index_objects('tower')
+        record_tower_changes(tower_ids)
+        queue_data_version_bump()
+
+    @transaction.atomic
+    def reload_incremental(self, rows):
+
+        def db_value(field, value):
+            # Compare values as they would be stored and read back, so that
+            # e.g. '52.386283' matches Decimal('52.386') and ['2nd', '4th']
+            # matches '2nd,4th'
+            value = field.to_python(value)
+            if isinstance(field, models.DecimalField) and value is not None:
+                value = value.quantize(Decimal(1).scaleb(-field.decimal_places), context=field.context)
+            return field.get_db_prep_save(value, connection)
+
+        towers = {t.dove_ringid: t for t in Tower.objects.select_related('primary_contact').prefetch_related('website_set')}
+        seen = set()
+        created = updated = deleted = 0
+
+        for csv_row in rows:
+
+            values, contact, website = parse_row(csv_row)
+
+            ringid = values['dove_ringid']
+            if not ringid or ringid in seen:
+                raise CommandError(f"{csv_row['Place']}: missing or duplicate Dove Ring ID '{ringid}'")
+            seen.add(ringid)
+
+            db_row = towers.get(ringid)
+            if db_row is None:
+                db_row = Tower(**values)
+                changed = ['(new)']
             else:
-                db_row.contact_use = 'None'
+                changed = []
+                for name, value in values.items():
+                    field = Tower._meta.get_field(name)
+                    if db_value(field, getattr(db_row, name)) != db_value(field, value):
+                        setattr(db_row, name, value)
+                        changed.append(name)
+
+            current = db_row.primary_contact
+            if current:
+                current = (current.name, current.phone, current.email)
+            if current != contact:
+                if contact:
+                    (db_row.primary_contact, c) = Contact.objects.get_or_create(name=contact[0], phone=contact[1], email=contact[2])
+                else:
+                    db_row.primary_contact = None
+                changed.append('primary_contact')
+
+            if changed:
+                self.stdout.write(f"{csv_row['Place']}: {', '.join(changed)}")
+                if db_row.pk is None:
+                    db_row.save()
+                    created += 1
+                else:
+                    db_row.save(update_fields=changed)
+                    updated += 1
+
+            # Websites are replaced wholesale if they differ
+            if {w.website for w in db_row.website_set.all()} != ({website} if website else set()):
+                db_row.website_set.all().delete()
+                if website:
+                    db_row.website_set.create(website=website)
+                self.stdout.write(f"{csv_row['Place']}: website")
 
-            db_row.save()
+        for db_row in Tower.objects.exclude(dove_ringid__in=seen):
+            self.stdout.write(f"{db_row.place}: (deleted)")
+            db_row.delete()
+            deleted += 1
 
-            if csv_row['Website']:
-                db_row.website_set.create(website=csv_row['Website'])
+        # Tidy up contacts that no longer belong to any tower
+        Contact.objects.filter(tower_primary_set=None, tower_oher_set=None).delete()
 
+        self.stdout.write(f"{created} created, {updated} updated, {deleted} deleted")
@@ -0,0 +1,65 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from database.dove_match import CONFIDENT_MARGIN, CONFIDENT_SCORE, apply_matches, is_confident, suggest_matches
+from database.models import DoveRing, Tower
+import time
+
+
+class Command(BaseCommand):
+    help = 'Suggest Dove rings for towers without a Dove RingID, and optionally set the confident ones'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+            help="Suggest for every tower, not just those without a RingID, and report how many agree with the RingID they have")
+        parser.add_argument("--limit", type=int, default=3, help="Suggestions to list for each tower (default 3)")
+        parser.add_argument("--threshold", type=float, default=CONFIDENT_SCORE,
+            help=f"Score a suggestion needs to be applied (default {CONFIDENT_SCORE})")
+        parser.add_argument("--margin", type=float, default=CONFIDENT_MARGIN,
+            help=f"How far it must be ahead of the next best (default {CONFIDENT_MARGIN})")
+        parser.add_argument("--apply", action="store_true",
+            help="Set the Dove RingID and TowerID of towers without a RingID that have a confident suggestion")
+        parser.add_argument("--stats", action="store_true", help="Report elapsed time")
+
+
+    def handle(self, *args, **options):
+
+        if options['limit'] < 2:
+            raise CommandError("--limit must be at least 2, to compare the best suggestion with the next")
+
+        start = time.perf_counter()
+        towers = Tower.objects.order_by('place', 'dedication')
+        if not options['all']:
+            towers = towers.filter(dove_ringid='')
+        towers = list(towers)
+        suggestions = suggest_matches(towers, options['limit'])
+        elapsed = time.perf_counter() - start
+
+        confident = []
+        agree = checked = 0
+        for tower, scored in suggestions:
+            sure = is_confident(scored, options['threshold'], options['margin'])
+            if sure:
+                confident.append((tower, scored[0][2]))
+            if tower.dove_ringid:
+                checked += 1
+                agree += bool(scored) and str(scored[0][2]['ringid']) == tower.dove_ringid
+
+            self.stdout.write(f"\n{tower.place} {tower.dedication} ({tower.bells or 0} bells){'  [confident]' if sure else ''}:")
+            if not scored:
+                self.stdout.write("    No candidates")
+            for total, parts, ring in scored:
+                current = '*' if str(ring['ringid']) == tower.dove_ringid else ' '
+                detail = ' '.join(f"{part} {value:.2f}" for part, value in parts.items())
+                self.stdout.write(f"  {current} {total:.2f}  RingID {ring['ringid']:<6} {ring['place']}, {ring['dedicn']}, "
+                                  f"{ring['bells'] or 0} bells  [{detail}]")
+
+        self.stdout.write(f"\n{len(confident)} of {len(towers)} towers have a confident suggestion")
+        if checked:
+            self.stdout.write(f"Best suggestion agrees with the existing RingID for {agree} of {checked} towers")
+
+        if options['apply']:
+            changed = apply_matches(confident)
+            self.stdout.write(f"{changed} towers updated")
+
+        if options['stats']:
+            self.stdout.write(f"{len(towers)} towers matched against {DoveRing.objects.count()} Dove rings in {elapsed:.3f}s")
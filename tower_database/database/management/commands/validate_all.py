@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from concurrent.futures import ProcessPoolExecutor
+from database.models import Tower
+from database.validation import validate_towers, duplicate_towers
+import csv
+import django
+import json
+import time
+
+from io import StringIO
+
+
+class Command(BaseCommand):
+    help = 'Validate every tower and report all the errors found'
+
+    def add_arguments(self, parser):
+        parser.add_argument("--format", choices=["json", "csv"], default="json", help="Report format (default json)")
+        parser.add_argument("--output", help="Write the report to this file, rather than standard output")
+        parser.add_argument("--workers", type=int, default=1, help="Number of worker processes (default 1, i.e. none)")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Towers per worker task (default 500)")
+
+
+    def handle(self, *args, **options):
+
+        if options['workers'] < 1 or options['chunk_size'] < 1:
+            raise CommandError("--workers and --chunk-size must be at least 1")
+
+        start = time.perf_counter()
+
+        towers = list(Tower.objects.all())
+
+        chunk_size = options['chunk_size']
+        chunks = [towers[i:i + chunk_size] for i in range(0, len(towers), chunk_size)]
+
+        if options['workers'] > 1 and len(chunks) > 1:
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=django.setup) as executor:
+                results = list(executor.map(validate_towers, chunks))
+        else:
+            results = [validate_towers(chunk) for chunk in chunks]
+
+        errors = duplicate_towers(towers) + [error for result in results for error in result]
+        errors.sort(key=lambda e: (e['field'], e['rule'], e['tower']))
+
+        elapsed = time.perf_counter() - start
+
+        out = StringIO()
+        if options['format'] == 'csv':
+            writer = csv.DictWriter(out, fieldnames=['field', 'rule', 'id', 'tower', 'message'])
+            writer.writeheader()
+            writer.writerows(errors)
+        else:
+            by_field = {}
+            for error in errors:
+                by_field.setdefault(error['field'], {}).setdefault(error['rule'], []).append(
+                    {'id': error['id'], 'tower': error['tower'], 'message': error['message']})
+            json.dump({'towers': len(towers), 'errors': len(errors), 'by_field': by_field}, out, indent=2)
+            out.write('\n')
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                f.write(out.getvalue())
+        else:
+            self.stdout.write(out.getvalue(), ending='')
+
+        self.stderr.write(f"{len(towers)} towers validated, {len(errors)} errors, in {elapsed:.3f}s")
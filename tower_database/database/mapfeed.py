@@ -0,0 +1,140 @@
+from math import cos, floor, log, pi, radians, tan
+from xml.sax.saxutils import escape
+import json
+
+from .geo import SOURCES as VERSIONS
+from .models import DoveRing, Tower
+
+# Points are clustered on a grid of CLUSTER_PIXELS square cells at every
+# zoom level up to MAX_ZOOM. Each level's cells are exactly four of the
+# next level's, so each level is built from the one below it.
+MAX_ZOOM = 16
+CLUSTER_PIXELS = 60
+TILE_SIZE = 256
+
+# Web Mercator stops short of the poles
+MAX_LATITUDE = 85.05112878
+
+
+def tower_points():
+    towers = Tower.objects.filter(lat__isnull=False, lng__isnull=False).order_by('pk')
+    return [(tower.pk, float(tower.lat), float(tower.lng), {
+                'name': str(tower), 'bells': tower.bells, 'ring_type': tower.get_ring_type_display(),
+                'ringing_status': tower.get_ringing_status_display(), 'district': tower.get_district_display()})
+            for tower in towers]
+
+
+def dove_points():
+    rings = (DoveRing.objects.filter(lat__isnull=False, long__isnull=False)
+             .order_by('pk').values_list('pk', 'lat', 'long', 'place', 'dedicn', 'bells', 'ringtype'))
+    return [(pk, lat, lng, {'name': f'{place}  ({dedicn})', 'bells': bells, 'ring_type': ringtype})
+            for pk, lat, lng, place, dedicn, bells, ringtype in rings]
+
+
+POINTS = {'tower': tower_points, 'dove': dove_points}
+
+_indexes = {}
+
+
+def project(lat, lng):
+    """Web Mercator x and y of (lat, lng), each from 0 to 1"""
+    lat = radians(max(-MAX_LATITUDE, min(MAX_LATITUDE, lat)))
+    return (lng + 180) / 360, (1 - log(tan(lat) + 1 / cos(lat)) / pi) / 2
+
+
+class ClusterIndex:
+
+    """
+    Points (id, lat, lng, properties) and, for each zoom level up to
+    MAX_ZOOM, the clusters they form on that level's grid, as
+    (lat, lng, count, id, properties) with the id and properties of a
+    point that has a cell to itself, and None for a cluster
+    """
+
+    def __init__(self, points):
+
+        # count, sum of latitudes, sum of longitudes and the first point,
+        # for each cell of the finest grid
+        scale = TILE_SIZE * 2 ** MAX_ZOOM / CLUSTER_PIXELS
+        cells = {}
+        for point in points:
+            x, y = project(point[1], point[2])
+            key = (floor(x * scale), floor(y * scale))
+            cell = cells.get(key)
+            if cell:
+                cell[0] += 1
+                cell[1] += point[1]
+                cell[2] += point[2]
+            else:
+                cells[key] = [1, point[1], point[2], point]
+
+        self.levels = {MAX_ZOOM + 1: [(lat, lng, 1, pk, properties) for pk, lat, lng, properties in points]}
+        for zoom in range(MAX_ZOOM, -1, -1):
+            self.levels[zoom] = [(lat / count, lng / count, count, *((point[0], point[3]) if count == 1 else (None, None)))
+                                 for count, lat, lng, point in cells.values()]
+            parents = {}
+            for (cx, cy), (count, lat, lng, point) in cells.items():
+                parent = parents.get((cx // 2, cy // 2))
+                if parent:
+                    parent[0] += count
+                    parent[1] += lat
+                    parent[2] += lng
+                else:
+                    parents[(cx // 2, cy // 2)] = [count, lat, lng, point]
+            cells = parents
+
+    def features(self, zoom, bbox=None):
+
+        """
+        The clusters and points to show at zoom, only those inside bbox
+        (west, south, east, north) if given
+        """
+
+        level = self.levels[max(0, min(zoom, MAX_ZOOM + 1))]
+        if bbox is None:
+            return level
+        west, south, east, north = bbox
+        return [f for f in level if south <= f[0] <= north and west <= f[1] <= east]
+
+
+def get_cluster_index(kind):
+
+    """
+    The ClusterIndex for 'tower' or 'dove', rebuilt whenever the towers (or
+    Dove) change
+    """
+
+    current = VERSIONS[kind][1]()
+    cached = _indexes.get(kind)
+    if cached is None or cached[0] != current:
+        cached = _indexes[kind] = (current, ClusterIndex(POINTS[kind]()))
+    return cached[1]
+
+
+def geojson(features):
+    """A GeoJSON FeatureCollection of features from ClusterIndex.features()"""
+    return json.dumps({
+        'type': 'FeatureCollection',
+        'features': [{
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [round(lng, 6), round(lat, 6)]},
+            'properties': {'id': pk, **properties} if pk is not None else {'cluster': True, 'count': count},
+        } for lat, lng, count, pk, properties in features],
+    })
+
+
+def kml(features, title):
+    """A KML document of features from ClusterIndex.features()"""
+    placemarks = []
+    for lat, lng, count, pk, properties in features:
+        if pk is None:
+            name, description = f'{count} towers', ''
+        else:
+            name = properties['name']
+            description = ', '.join(f'{key.replace("_", " ")}: {value}' for key, value in properties.items()
+                                    if key != 'name' and value not in (None, ''))
+        placemarks.append(f'<Placemark><name>{escape(name)}</name><description>{escape(description)}</description>'
+                          f'<Point><coordinates>{lng:.6f},{lat:.6f}</coordinates></Point></Placemark>')
+    return ('<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<kml xmlns="http://www.opengis.net/kml/2.2"><Document>'
+            f'<name>{escape(title)}</name>\n' + '\n'.join(placemarks) + '\n</Document></kml>\n')
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0023_practiceslot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchWord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=10)),
+                ('object_id', models.CharField(max_length=20)),
+                ('word', models.CharField(max_length=100)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'word'], name='search_word'), models.Index(fields=['kind', 'object_id'], name='search_word_object')],
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0024_searchword'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoveRing',
+            fields=[
+                ('ringid', models.PositiveIntegerField(primary_key=True, serialize=False, verbose_name='RingID')),
+                ('towerid', models.PositiveIntegerField(db_index=True, verbose_name='TowerID')),
+                ('ringtype', models.CharField(blank=True, db_index=True, max_length=30, verbose_name='Ring type')),
+                ('place', models.CharField(blank=True, max_length=100)),
+                ('place2', models.CharField(blank=True, max_length=100)),
+                ('placecl', models.CharField(blank=True, max_length=100)),
+                ('dedicn', models.CharField(blank=True, max_length=100, verbose_name='Dedication')),
+                ('towerstatus', models.CharField(blank=True, max_length=50)),
+                ('statusfirst', models.CharField(blank=True, max_length=10)),
+                ('barededicn', models.CharField(blank=True, max_length=100)),
+                ('altname', models.CharField(blank=True, max_length=100)),
+                ('ringname', models.CharField(blank=True, max_length=100)),
+                ('region', models.CharField(blank=True, max_length=100)),
+                ('county', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('country', models.CharField(blank=True, db_index=True, max_length=50)),
+                ('histregion', models.CharField(blank=True, max_length=100)),
+                ('iso3166code', models.CharField(blank=True, max_length=10)),
+                ('diocese', models.CharField(blank=True, db_index=True, max_length=100)),
+                ('lat', models.FloatField(blank=True, null=True)),
+                ('long', models.FloatField(blank=True, null=True)),
+                ('bells', models.PositiveSmallIntegerField(blank=True, db_index=True, null=True)),
+                ('ur', models.CharField(blank=True, max_length=10, verbose_name='UR')),
+                ('semitones', models.CharField(blank=True, max_length=50)),
+                ('wt', models.FloatField(blank=True, null=True, verbose_name='Weight (lbs)')),
+                ('app', models.CharField(blank=True, max_length=10)),
+                ('note', models.CharField(blank=True, max_length=10)),
+                ('hz', models.FloatField(blank=True, null=True, verbose_name='Hz')),
+                ('details', models.CharField(blank=True, max_length=10)),
+                ('gf', models.CharField(blank=True, max_length=10, verbose_name='GF')),
+                ('toilet', models.CharField(blank=True, max_length=10)),
+                ('simulator', models.CharField(blank=True, max_length=10)),
+                ('extrainfo', models.TextField(blank=True)),
+                ('webpage', models.TextField(blank=True)),
+                ('affiliations', models.TextField(blank=True)),
+                ('ng', models.CharField(blank=True, max_length=20, verbose_name='NG')),
+                ('postcode', models.CharField(blank=True, max_length=20)),
+                ('practice', models.TextField(blank=True)),
+                ('ovhaulyr', models.CharField(blank=True, max_length=20)),
+                ('contractor', models.CharField(blank=True, max_length=100)),
+                ('tuneyr', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('lgrade', models.CharField(blank=True, max_length=10)),
+                ('bldgid', models.CharField(blank=True, max_length=20)),
+                ('churchcare', models.CharField(blank=True, max_length=20)),
+                ('chrassetid', models.CharField(blank=True, max_length=20)),
+                ('towerbase', models.CharField(blank=True, max_length=10)),
+                ('doveid', models.CharField(blank=True, max_length=20)),
+                ('snlat', models.FloatField(blank=True, null=True)),
+                ('snlong', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'verbose_name': 'Dove tower',
+                'ordering': ['place', 'dedicn'],
+            },
+        ),
+    ]
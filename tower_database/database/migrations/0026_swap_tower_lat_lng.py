@@ -0,0 +1,22 @@
+from django.db import migrations
+from django.db.models import F
+
+
+def swap_lat_lng(apps, schema_editor):
+    # reload_data used to store the master list's Lng in lat and Lat in
+    # lng. Every tower is in East Anglia, so lat < lng means swapped.
+    Tower = apps.get_model('database', 'Tower')
+    Tower.objects.filter(lat__lt=F('lng')).update(lat=F('lng'), lng=F('lat'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0025_dovering'),
+    ]
+
+    operations = [
+        # There's no telling afterwards which towers were swapped, and
+        # there's no need to swap them back, so unapplying does nothing
+        migrations.RunPython(swap_lat_lng, migrations.RunPython.noop),
+    ]
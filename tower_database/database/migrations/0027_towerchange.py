@@ -0,0 +1,62 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:59
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def changes(previous, record, fields, names):
+    # As database.history.diff_values, which migrations shouldn't import
+    if previous is None:
+        return [[names[f], None, record[f]] for f in fields if record[f] not in (None, '', False) and record[f] != []]
+    return [[names[f], previous[f], record[f]] for f in fields if previous[f] != record[f]]
+
+
+def record_existing_changes(apps, schema_editor):
+
+    # So that change logs cover the history from before there were
+    # TowerChanges, as rebuild_tower_changes would
+    HistoricalTower = apps.get_model('database', 'HistoricalTower')
+    TowerChange = apps.get_model('database', 'TowerChange')
+
+    model_fields = [f for f in HistoricalTower._meta.fields if not f.name.startswith('history_') and f.attname != 'id']
+    fields = [f.attname for f in model_fields]
+    names = {f.attname: f.name for f in model_fields}
+    previous = {}
+    created = []
+    for record in (HistoricalTower.objects.order_by('id', 'history_date', 'history_id')
+                   .values('id', 'history_id', 'history_date', 'history_type', *fields).iterator()):
+        diff = ([] if record['history_type'] == '-' else
+                changes(None if record['history_type'] == '+' else previous.get(record['id']), record, fields, names))
+        created.append(TowerChange(history_id=record['history_id'], tower_id=record['id'],
+                                   history_date=record['history_date'], history_type=record['history_type'], changes=diff))
+        previous[record['id']] = record
+        if len(created) == 500:
+            TowerChange.objects.bulk_create(created)
+            created = []
+    TowerChange.objects.bulk_create(created)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0026_swap_tower_lat_lng'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TowerChange',
+            fields=[
+                ('history', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='change', serialize=False, to='database.historicaltower')),
+                ('tower_id', models.IntegerField()),
+                ('history_date', models.DateTimeField(db_index=True)),
+                ('history_type', models.CharField(max_length=1)),
+                ('changes', models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+            ],
+            options={
+                'ordering': ['-history_date'],
+                'indexes': [models.Index(fields=['tower_id', '-history_date'], name='tower_change_tower')],
+            },
+        ),
+        migrations.RunPython(record_existing_changes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0027_towerchange'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dovering',
+            name='bells',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='dovering',
+            name='county',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='dovering',
+            name='diocese',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='dovering',
+            index=models.Index(fields=['county', 'ringid'], name='dove_ring_county'),
+        ),
+        migrations.AddIndex(
+            model_name='dovering',
+            index=models.Index(fields=['diocese', 'ringid'], name='dove_ring_diocese'),
+        ),
+        migrations.AddIndex(
+            model_name='dovering',
+            index=models.Index(fields=['bells', 'ringid'], name='dove_ring_bells'),
+        ),
+    ]
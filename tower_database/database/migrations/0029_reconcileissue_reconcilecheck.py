@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0028_dovering_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReconcileCheck',
+            fields=[
+                ('tower', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='reconcile_check', serialize=False, to='database.tower')),
+                ('tower_hash', models.CharField(max_length=40)),
+                ('dove_hash', models.CharField(max_length=40)),
+                ('checked_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReconcileIssue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('test', models.CharField(max_length=20)),
+                ('ours', models.TextField(blank=True)),
+                ('theirs', models.TextField(blank=True)),
+                ('first_seen', models.DateTimeField()),
+                ('resolved_at', models.DateTimeField(blank=True, null=True)),
+                ('tower', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reconcile_issues', to='database.tower')),
+            ],
+            options={
+                'ordering': ['tower', 'test'],
+                'indexes': [models.Index(condition=models.Q(('resolved_at__isnull', True)), fields=['tower', 'test'], name='reconcile_issue_open'), models.Index(fields=['test', 'resolved_at'], name='reconcile_issue_test')],
+            },
+        ),
+    ]
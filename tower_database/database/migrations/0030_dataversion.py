@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-17 20:21
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0029_reconcileissue_reconcilecheck'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('changed', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,50 @@
+from django.db import migrations
+from django.db.models import F
+
+
+def changes(previous, record, fields, names):
+    # As database.history.diff_values, which migrations shouldn't import
+    if previous is None:
+        return [[names[f], None, record[f]] for f in fields if record[f] not in (None, '', False) and record[f] != []]
+    return [[names[f], previous[f], record[f]] for f in fields if previous[f] != record[f]]
+
+
+def swap_historical_lat_lng(apps, schema_editor):
+
+    # 0026 swapped the towers that reload_data had loaded with lat and lng
+    # the wrong way round, but not their historical records, so snapshots
+    # and change logs from before then still had them swapped
+    HistoricalTower = apps.get_model('database', 'HistoricalTower')
+    TowerChange = apps.get_model('database', 'TowerChange')
+
+    swapped = HistoricalTower.objects.filter(lat__lt=F('lng'))
+    tower_ids = set(swapped.values_list('id', flat=True))
+    swapped.update(lat=F('lng'), lng=F('lat'))
+
+    # Work out those towers' changes again
+    model_fields = [f for f in HistoricalTower._meta.fields if not f.name.startswith('history_') and f.attname != 'id']
+    fields = [f.attname for f in model_fields]
+    names = {f.attname: f.name for f in model_fields}
+    recorded = set(TowerChange.objects.filter(tower_id__in=tower_ids).values_list('history_id', flat=True))
+    previous = {}
+    updated = []
+    for record in (HistoricalTower.objects.filter(id__in=tower_ids)
+                   .order_by('id', 'history_date', 'history_id').values('id', 'history_id', 'history_type', *fields)):
+        if record['history_id'] in recorded:
+            diff = ([] if record['history_type'] == '-' else
+                    changes(None if record['history_type'] == '+' else previous.get(record['id']), record, fields, names))
+            updated.append(TowerChange(history_id=record['history_id'], changes=diff))
+        previous[record['id']] = record
+    TowerChange.objects.bulk_update(updated, ['changes'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0030_dataversion'),
+    ]
+
+    operations = [
+        # As with 0026, unapplying does nothing
+        migrations.RunPython(swap_historical_lat_lng, migrations.RunPython.noop),
+    ]
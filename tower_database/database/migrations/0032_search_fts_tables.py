@@ -0,0 +1,37 @@
+from django.db import migrations
+
+# As database.search.fts_table()
+TABLES = ('search_tower_fts', 'search_dove_fts')
+
+
+def has_fts5(connection):
+    if connection.vendor != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA compile_options")
+        return 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+
+
+def create_fts_tables(apps, schema_editor):
+    # Only where FTS5 is available; elsewhere database.search uses SearchWord.
+    # IF NOT EXISTS, as database.search used to create them itself.
+    if has_fts5(schema_editor.connection):
+        for table in TABLES:
+            schema_editor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(text, prefix='1 2 3')")
+
+
+def drop_fts_tables(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for table in TABLES:
+            schema_editor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('database', '0031_swap_historical_tower_lat_lng'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_tables, drop_fts_tables),
+    ]
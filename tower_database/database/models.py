@@ -1,13 +1,17 @@
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 from django.db.models import Q
+from django.utils import timezone
 
 from multiselectfield import MultiSelectField
 from simple_history.models import HistoricalRecords
 
+import datetime
 import re
 
-from collections import defaultdict
+from collections import defaultdict, namedtuple
+from functools import lru_cache
 
 # Create your models here.
 
@@ -57,6 +61,62 @@ class TowerConstants():
     # Valid phrases for week patterns
     WEEK_PHRASE_PATTERN = re.compile(r'1st|2nd|3rd|4th|5th')
 
+    # Times of day, as '19:30' or '19.30'
+    TIME_PATTERN = re.compile(r'\b([01]?\d|2[0-3])[:.]([0-5]\d)\b')
+
+    # Between the two times of a range, as in '18:00-19:30' or '18.00 to 19.30'
+    TIME_RANGE_PATTERN = re.compile(r'\s*(-|–|to)\s*')
+
+    # All four of the above in one pass
+    PRACTICE_PATTERN = re.compile(
+        r'(?P<check>(?i:\b(check(?! if Bank Holiday)|by arrangement|by invitation)\b))|'
+        r'(?P<day>(?i:\b(Monday|Tuesday|Wednesday|Thursday|Friday|Saturday|Sunday)s?\b))|'
+        r'(?P<week>1st|2nd|3rd|4th|5th)|'
+        r'(?P<time>\b([01]?\d|2[0-3])[:.]([0-5]\d)\b)')
+
+
+PracticeText = namedtuple('PracticeText', ['lower', 'check', 'days', 'weeks', 'times', 'starts'])
+
+
+@lru_cache(maxsize=1024)
+def analyse_practice(practice):
+
+    """
+    Scan a practice description once, returning a PracticeText with its
+    lower-case form, whether it mentions 'check' (CHECK_PATTERN), and the
+    days of the week (WEEKDAY_PATTERN), week phrases (WEEK_PHRASE_PATTERN)
+    and times (TIME_PATTERN, as datetime.time) it contains, in order, and
+    which of those times are start times (not the end of a range such as
+    '18:00-19:30').
+    """
+
+    check = False
+    days = []
+    weeks = []
+    times = []
+    starts = []
+    range_from = None
+    for match in TowerConstants.PRACTICE_PATTERN.finditer(practice):
+        if match['check']:
+            check = True
+        elif match['day']:
+            days.append(match['day'])
+        elif match['week']:
+            weeks.append(match['week'])
+        else:
+            hour, minute = TowerConstants.TIME_PATTERN.fullmatch(match['time']).groups()
+            times.append(datetime.time(int(hour), int(minute)))
+            if range_from is not None and TowerConstants.TIME_RANGE_PATTERN.fullmatch(practice, range_from, match.start()):
+                range_from = None
+            else:
+                starts.append(times[-1])
+                range_from = match.end()
+            continue
+        range_from = None
+
+    return PracticeText(practice.lower(), check, tuple(days), tuple(weeks), tuple(times), tuple(starts))
+
+
 class Tower(models.Model):
 
     class Counties(models.TextChoices):
@@ -207,6 +267,34 @@ class Tower(models.Model):
     def felstead_link(self):
         return f"https://felstead.cccbr.org.uk/tbid.php?tid={self.towerbase_id}"
 
+    def get_practice_slots(self):
+
+        """
+        Return (unsaved) PracticeSlots describing the main practice, from
+        practice_day, practice_weeks and any times in practice
+        """
+
+        if not self.practice_day:
+            return []
+
+        weekday = Tower.Days.values.index(self.practice_day)
+
+        numbered = {int(w[0]) for w in self.practice_weeks if w in (
+            Tower.PracticeWeeks.W1, Tower.PracticeWeeks.W2, Tower.PracticeWeeks.W3,
+            Tower.PracticeWeeks.W4, Tower.PracticeWeeks.W5)}
+        if Tower.PracticeWeeks.ALT in self.practice_weeks:
+            weeks = [None]
+        elif Tower.PracticeWeeks.NOT in self.practice_weeks:
+            weeks = sorted({1, 2, 3, 4, 5} - numbered)
+        elif numbered:
+            weeks = sorted(numbered)
+        else:
+            weeks = [1, 2, 3, 4, 5]
+
+        times = sorted(set(analyse_practice(self.practice).starts)) or [None]
+
+        return [PracticeSlot(tower=self, weekday=weekday, week=week, start=start) for week in weeks for start in times]
+
 
     def clean(self):
 
@@ -216,29 +304,31 @@ class Tower(models.Model):
 
         errors = defaultdict(list)
 
+        practice = analyse_practice(self.practice)
+
         # ringing & saervice/practice
         if self.ringing_status == Tower.RingingStatus.NONE and (self.service or self.practice):
             errors['ringing_status'].append(f"Iinconsistent with Service or Practice")
 
         # practice_day & practice
-        if ((self.get_practice_day_display().lower() not in self.practice.lower()) or
-           (TowerConstants.WEEKDAY_PATTERN.search(self.practice) and not self.practice_day)):
+        if ((self.get_practice_day_display().lower() not in practice.lower) or
+           (practice.days and not self.practice_day)):
             errors['practice_day'].append(f"Inconsistent with Practice")
 
         # ravel_check & practice
-        if TowerConstants.CHECK_PATTERN.search(self.practice) and not self.travel_check:
+        if practice.check and not self.travel_check:
             errors['travel_check'].append(f"Practice mentions 'check'")
-        elif self.travel_check and not TowerConstants.CHECK_PATTERN.search(self.practice):
+        elif self.travel_check and not practice.check:
             errors['travel_check'].append(f"Practice doesn't mention 'check'")
 
         # practice_weeks & practice
-        if not TowerConstants.CHECK_PATTERN.search(self.practice):
-            for phrase in TowerConstants.WEEK_PHRASE_PATTERN.findall(self.practice):
+        if not practice.check:
+            for phrase in practice.weeks:
                 if phrase not in self.practice_weeks:
                     errors['practice_weeks'].append(f"'{phrase}' appears in in Practice")
 
         for phrase in self.practice_weeks:
-            if phrase.lower() not in self.practice.lower():
+            if phrase.lower() not in practice.lower:
                 errors['practice_weeks'].append(f"'{phrase}' doesn't appear in Practice")
 
 
@@ -254,6 +344,122 @@ class Tower(models.Model):
         ]
 
 
+class PracticeSlot(models.Model):
+
+    """
+    One practice (weekday, week of the month, start time) of a tower,
+    derived from the tower by Tower.get_practice_slots() and kept up to
+    date by a signal (or the rebuild_practice_slots command), so that e.g.
+
+        Tower.objects.filter(practice_slots__weekday=1, practice_slots__week=2,
+                             practice_slots__start__gte=datetime.time(19, 0))
+
+    finds towers practising on the 2nd Tuesday at or after 19:00
+    """
+
+    tower = models.ForeignKey(Tower, on_delete=models.CASCADE, related_name="practice_slots")
+    weekday = models.PositiveSmallIntegerField(help_text="Day of the week, Monday = 0")
+    week = models.PositiveSmallIntegerField(null=True, blank=True, help_text="Week of the month (1-5), or blank for alternate weeks")
+    start = models.TimeField(null=True, blank=True, help_text="Start time, if known")
+
+    def __str__(self):
+        return f'{self.tower} - {Tower.Days.labels[self.weekday]} week {self.week} {self.start}'
+
+    class Meta:
+        ordering = ["tower", "weekday", "week", "start"]
+        indexes = [
+            models.Index(fields=["weekday", "week", "start"], name="practice_slot_when"),
+        ]
+
+
+class TowerChange(models.Model):
+
+    """
+    The fields changed by one historical Tower record, as a list of
+    [field, old value, new value], worked out when the record is created
+    (or by the rebuild_tower_changes command) so that change logs don't
+    have to compare whole snapshots. Creations list the fields set.
+    """
+
+    history = models.OneToOneField("HistoricalTower", on_delete=models.CASCADE, primary_key=True, related_name="change")
+    tower_id = models.IntegerField()
+    history_date = models.DateTimeField(db_index=True)
+    history_type = models.CharField(max_length=1)
+    changes = models.JSONField(default=list, encoder=DjangoJSONEncoder)
+
+    def __str__(self):
+        return f'{self.history} - {", ".join(c[0] for c in self.changes) or self.get_history_type_display()}'
+
+    def get_history_type_display(self):
+        return {'+': 'Created', '~': 'Changed', '-': 'Deleted'}.get(self.history_type, self.history_type)
+
+    class Meta:
+        ordering = ["-history_date"]
+        indexes = [
+            models.Index(fields=["tower_id", "-history_date"], name="tower_change_tower"),
+        ]
+
+
+class DataVersion(models.Model):
+
+    """
+    A single row counting changes to the data served by the API (and when
+    it last changed), bumped whenever a Tower, Contact, ContactMap or
+    Website is saved or deleted. API responses are cached against it and
+    it is their ETag, so it lives here rather than in a cache that could
+    lose it and start counting again.
+    """
+
+    version = models.PositiveIntegerField(default=1)
+    changed = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f'{self.version} ({self.changed})'
+
+
+class ReconcileIssue(models.Model):
+
+    """
+    A difference between a tower and its Dove entry found by
+    reconsile_with_dove, open until a later run no longer finds it
+    """
+
+    tower = models.ForeignKey(Tower, on_delete=models.CASCADE, related_name="reconcile_issues")
+    test = models.CharField(max_length=20)
+    ours = models.TextField(blank=True)
+    theirs = models.TextField(blank=True)
+    first_seen = models.DateTimeField()
+    resolved_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.tower} - {self.test}'
+
+    class Meta:
+        ordering = ["tower", "test"]
+        indexes = [
+            # Only open issues, so 'towers with open issues' reads just these
+            models.Index(fields=["tower", "test"], condition=Q(resolved_at__isnull=True), name="reconcile_issue_open"),
+            models.Index(fields=["test", "resolved_at"], name="reconcile_issue_test"),
+        ]
+
+
+class ReconcileCheck(models.Model):
+
+    """
+    Hashes of the values compared by reconsile_with_dove when a tower was
+    last checked, its own and its Dove entry's, so that later runs can
+    skip towers where neither has changed
+    """
+
+    tower = models.OneToOneField(Tower, on_delete=models.CASCADE, primary_key=True, related_name="reconcile_check")
+    tower_hash = models.CharField(max_length=40)
+    dove_hash = models.CharField(max_length=40)
+    checked_at = models.DateTimeField()
+
+    def __str__(self):
+        return f'{self.tower} - {self.checked_at}'
+
+
 class Website(models.Model):
 
     tower = models.ForeignKey(Tower, on_delete=models.CASCADE)
@@ -296,6 +502,23 @@ class ContactMap(models.Model):
         #unique_together = ['tower', 'contact']
         ordering = ["tower", "role"]
 
+class SearchWord(models.Model):
+
+    """
+    Word index for admin search where SQLite FTS5 isn't available. Maintained
+    by database.search; don't edit.
+    """
+
+    kind = models.CharField(max_length=10)
+    object_id = models.CharField(max_length=20)
+    word = models.CharField(max_length=100)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["kind", "word"], name="search_word"),
+            models.Index(fields=["kind", "object_id"], name="search_word_object"),
+        ]
+
 # Auto-generated with ./manage.py inspectdb
 
 class DoveTower(models.Model):
@@ -355,4 +578,75 @@ class DoveTower(models.Model):
     class Meta:
         managed = False
         db_table = 'dove_towers'
-        ordering = ["place", "dedicn"]
\ No newline at end of file
+        ordering = ["place", "dedicn"]
+
+
+class DoveRing(models.Model):
+
+    """
+    A typed, indexed copy of DoveTower, rebuilt from it by load_dove
+    """
+
+    ringid = models.PositiveIntegerField(primary_key=True, verbose_name="RingID")
+    towerid = models.PositiveIntegerField(db_index=True, verbose_name="TowerID")
+    ringtype = models.CharField(max_length=30, blank=True, db_index=True, verbose_name="Ring type")
+    place = models.CharField(max_length=100, blank=True)
+    place2 = models.CharField(max_length=100, blank=True)
+    placecl = models.CharField(max_length=100, blank=True)
+    dedicn = models.CharField(max_length=100, blank=True, verbose_name="Dedication")
+    towerstatus = models.CharField(max_length=50, blank=True)
+    statusfirst = models.CharField(max_length=10, blank=True)
+    barededicn = models.CharField(max_length=100, blank=True)
+    altname = models.CharField(max_length=100, blank=True)
+    ringname = models.CharField(max_length=100, blank=True)
+    region = models.CharField(max_length=100, blank=True)
+    county = models.CharField(max_length=100, blank=True)
+    country = models.CharField(max_length=50, blank=True, db_index=True)
+    histregion = models.CharField(max_length=100, blank=True)
+    iso3166code = models.CharField(max_length=10, blank=True)
+    diocese = models.CharField(max_length=100, blank=True)
+    lat = models.FloatField(null=True, blank=True)
+    long = models.FloatField(null=True, blank=True)
+    bells = models.PositiveSmallIntegerField(null=True, blank=True)
+    ur = models.CharField(max_length=10, blank=True, verbose_name="UR")
+    semitones = models.CharField(max_length=50, blank=True)
+    wt = models.FloatField(null=True, blank=True, verbose_name="Weight (lbs)")
+    app = models.CharField(max_length=10, blank=True)
+    note = models.CharField(max_length=10, blank=True)
+    hz = models.FloatField(null=True, blank=True, verbose_name="Hz")
+    details = models.CharField(max_length=10, blank=True)
+    gf = models.CharField(max_length=10, blank=True, verbose_name="GF")
+    toilet = models.CharField(max_length=10, blank=True)
+    simulator = models.CharField(max_length=10, blank=True)
+    extrainfo = models.TextField(blank=True)
+    webpage = models.TextField(blank=True)
+    affiliations = models.TextField(blank=True)
+    ng = models.CharField(max_length=20, blank=True, verbose_name="NG")
+    postcode = models.CharField(max_length=20, blank=True)
+    practice = models.TextField(blank=True)
+    ovhaulyr = models.CharField(max_length=20, blank=True)
+    contractor = models.CharField(max_length=100, blank=True)
+    tuneyr = models.PositiveSmallIntegerField(null=True, blank=True)
+    lgrade = models.CharField(max_length=10, blank=True)
+    bldgid = models.CharField(max_length=20, blank=True)
+    churchcare = models.CharField(max_length=20, blank=True)
+    chrassetid = models.CharField(max_length=20, blank=True)
+    towerbase = models.CharField(max_length=10, blank=True)
+    doveid = models.CharField(max_length=20, blank=True)
+    snlat = models.FloatField(null=True, blank=True)
+    snlong = models.FloatField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.place}  ({self.dedicn})'
+
+    class Meta:
+        verbose_name = "Dove tower"
+        ordering = ["place", "dedicn"]
+        # With ringid, so that the Dove API can page through filtered rings
+        # in ringid order straight from the index
+        indexes = [
+            models.Index(fields=["county", "ringid"], name="dove_ring_county"),
+            models.Index(fields=["diocese", "ringid"], name="dove_ring_diocese"),
+            models.Index(fields=["bells", "ringid"], name="dove_ring_bells"),
+        ]
+
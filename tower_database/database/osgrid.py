@@ -0,0 +1,156 @@
+"""
+Conversion of Ordnance Survey National Grid references to WGS84 latitude
+and longitude, following 'A guide to coordinate systems in Great Britain'
+(Ordnance Survey). The Helmert transformation used is good to about 5
+metres.
+"""
+
+import math
+
+# Airy 1830 ellipsoid, and the National Grid projection on it
+AIRY_A, AIRY_B = 6377563.396, 6356256.909
+F0 = 0.9996012717
+LAT0, LNG0 = math.radians(49), math.radians(-2)
+E0, N0 = 400000, -100000
+
+# WGS84 ellipsoid
+WGS84_A, WGS84_B = 6378137.0, 6356752.314245
+
+# OSGB36 to WGS84 Helmert transformation: metres, ppm, arc seconds
+TX, TY, TZ = 446.448, -125.157, 542.060
+S = -20.4894
+RX, RY, RZ = 0.1502, 0.2470, 0.8421
+
+# Grid letters skip 'I'. The first letter of a reference picks a 500km
+# square; only H, J, N, O, S and T cover Great Britain.
+LETTERS = 'ABCDEFGHJKLMNOPQRSTUVWXYZ'
+GB_SQUARES = 'HJNOST'
+
+# (easting, northing) of the south west corner of each 100km square
+SQUARES = {
+    l1 + l2: ((((LETTERS.index(l1) - 2) % 5) * 5 + LETTERS.index(l2) % 5) * 100000,
+              ((19 - (LETTERS.index(l1) // 5) * 5) - LETTERS.index(l2) // 5) * 100000)
+    for l1 in GB_SQUARES for l2 in LETTERS
+}
+
+
+def grid_to_en(ref):
+
+    """
+    (easting, northing) in metres of the centre of the square that a
+    National Grid reference such as 'TL230780' or 'TL 2304 7801'
+    identifies, or None if it isn't a GB grid reference
+    """
+
+    ref = ref.upper().replace(' ', '')
+    square = SQUARES.get(ref[:2])
+    digits = ref[2:]
+    if square is None or not digits.isdigit() or not 2 <= len(digits) <= 10 or len(digits) % 2:
+        return None
+
+    half = len(digits) // 2
+    scale = 10 ** (5 - half)
+    return (square[0] + int(digits[:half]) * scale + scale / 2,
+            square[1] + int(digits[half:]) * scale + scale / 2)
+
+
+def _en_to_osgb36(e, n):
+
+    """Inverse Transverse Mercator projection: OSGB36 lat/lng in radians"""
+
+    a, b = AIRY_A, AIRY_B
+    e2 = 1 - (b * b) / (a * a)
+    nn = (a - b) / (a + b)
+
+    def meridional_arc(lat):
+        return b * F0 * (
+            (1 + nn + 5 / 4 * nn ** 2 + 5 / 4 * nn ** 3) * (lat - LAT0)
+            - (3 * nn + 3 * nn ** 2 + 21 / 8 * nn ** 3) * math.sin(lat - LAT0) * math.cos(lat + LAT0)
+            + (15 / 8 * nn ** 2 + 15 / 8 * nn ** 3) * math.sin(2 * (lat - LAT0)) * math.cos(2 * (lat + LAT0))
+            - 35 / 24 * nn ** 3 * math.sin(3 * (lat - LAT0)) * math.cos(3 * (lat + LAT0)))
+
+    lat = LAT0 + (n - N0) / (a * F0)
+    m = meridional_arc(lat)
+    while abs(n - N0 - m) >= 0.00001:
+        lat = lat + (n - N0 - m) / (a * F0)
+        m = meridional_arc(lat)
+
+    sin_lat, cos_lat, tan_lat = math.sin(lat), math.cos(lat), math.tan(lat)
+    nu = a * F0 / math.sqrt(1 - e2 * sin_lat ** 2)
+    rho = a * F0 * (1 - e2) / (1 - e2 * sin_lat ** 2) ** 1.5
+    eta2 = nu / rho - 1
+    sec_lat = 1 / cos_lat
+
+    vii = tan_lat / (2 * rho * nu)
+    viii = tan_lat / (24 * rho * nu ** 3) * (5 + 3 * tan_lat ** 2 + eta2 - 9 * tan_lat ** 2 * eta2)
+    ix = tan_lat / (720 * rho * nu ** 5) * (61 + 90 * tan_lat ** 2 + 45 * tan_lat ** 4)
+    x = sec_lat / nu
+    xi = sec_lat / (6 * nu ** 3) * (nu / rho + 2 * tan_lat ** 2)
+    xii = sec_lat / (120 * nu ** 5) * (5 + 28 * tan_lat ** 2 + 24 * tan_lat ** 4)
+    xiia = sec_lat / (5040 * nu ** 7) * (61 + 662 * tan_lat ** 2 + 1320 * tan_lat ** 4 + 720 * tan_lat ** 6)
+
+    de = e - E0
+    return (lat - vii * de ** 2 + viii * de ** 4 - ix * de ** 6,
+            LNG0 + x * de - xi * de ** 3 + xii * de ** 5 - xiia * de ** 7)
+
+
+def _osgb36_to_wgs84(lat, lng):
+
+    """Helmert transformation from OSGB36 to WGS84, via Cartesian coordinates"""
+
+    # To Cartesian on the Airy ellipsoid (height 0)
+    e2 = 1 - (AIRY_B * AIRY_B) / (AIRY_A * AIRY_A)
+    nu = AIRY_A / math.sqrt(1 - e2 * math.sin(lat) ** 2)
+    x1 = nu * math.cos(lat) * math.cos(lng)
+    y1 = nu * math.cos(lat) * math.sin(lng)
+    z1 = (1 - e2) * nu * math.sin(lat)
+
+    s = S / 1e6
+    rx, ry, rz = (math.radians(r / 3600) for r in (RX, RY, RZ))
+    x2 = TX + (1 + s) * x1 - rz * y1 + ry * z1
+    y2 = TY + rz * x1 + (1 + s) * y1 - rx * z1
+    z2 = TZ - ry * x1 + rx * y1 + (1 + s) * z1
+
+    # Back to latitude and longitude on the WGS84 ellipsoid
+    e2 = 1 - (WGS84_B * WGS84_B) / (WGS84_A * WGS84_A)
+    p = math.sqrt(x2 ** 2 + y2 ** 2)
+    lat = math.atan2(z2, p * (1 - e2))
+    while True:
+        nu = WGS84_A / math.sqrt(1 - e2 * math.sin(lat) ** 2)
+        previous, lat = lat, math.atan2(z2 + e2 * nu * math.sin(lat), p)
+        if abs(lat - previous) < 1e-12:
+            break
+    lng = math.atan2(y2, x2)
+
+    return lat, lng
+
+
+def en_to_wgs84(eastings, northings):
+
+    """
+    Lists of WGS84 latitudes and longitudes, in degrees, for lists of
+    National Grid eastings and northings
+    """
+
+    lats, lngs = [], []
+    for e, n in zip(eastings, northings):
+        lat, lng = _osgb36_to_wgs84(*_en_to_osgb36(float(e), float(n)))
+        lats.append(math.degrees(lat))
+        lngs.append(math.degrees(lng))
+    return lats, lngs
+
+
+def grid_refs_to_wgs84(refs):
+
+    """
+    A list with the WGS84 (lat, lng) of each National Grid reference in
+    refs, or None for any that aren't GB grid references
+    """
+
+    en = [grid_to_en(ref) if ref else None for ref in refs]
+    valid = [i for i, point in enumerate(en) if point]
+    lats, lngs = en_to_wgs84([en[i][0] for i in valid], [en[i][1] for i in valid])
+    result = [None] * len(refs)
+    for i, lat, lng in zip(valid, lats, lngs):
+        result[i] = (lat, lng)
+    return result
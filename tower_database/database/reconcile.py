@@ -0,0 +1,183 @@
+from django.db import transaction
+from django.utils import timezone
+
+from urllib.parse import urlparse
+import hashlib
+
+from .dedications import dove_dedication
+from .models import ReconcileCheck, ReconcileIssue
+
+# Change this when the tests change, so that every tower is checked again
+CHECKS_VERSION = 1
+
+
+def is_eq(eda, dove):
+    return str(eda) == str(dove)
+
+
+def is_county_eq(eda, dove):
+    return eda == dove[0]
+
+
+def is_dedication_eq(eda, dove):
+    return dove_dedication(eda) == dove
+
+
+def is_status_believable(eda, dove):
+    if dove != '':
+        return eda == 'N'
+    return True
+
+
+def is_type_eq(eda, dove):
+
+    if eda == '' and dove == 'Full-circle ring':
+        return True
+    return eda == dove
+
+
+def is_bool_eq(eda, dove):
+    return (dove != '')  == eda
+
+
+def web_page_eq(eda, dove):
+    eda_parsed = urlparse(eda)
+    dove_parsed = urlparse(dove)
+    if eda_parsed.hostname == 'dove.cccbr.org.uk':
+        return True
+    return (eda_parsed.netloc == dove_parsed.netloc and
+            eda_parsed.path == dove_parsed.path and
+            eda_parsed.query == dove_parsed.query)
+
+
+TESTS = (
+    ( 'TowerID', 'dove_towerid', 'towerid', is_eq ),
+    ( 'Place', 'place', 'place', is_eq ),
+    ( 'County', 'county', 'county', is_county_eq ),
+    ( 'Dedication', 'dedication', 'dedicn', is_dedication_eq ),
+    ( 'Status', 'ringing_status', 'ur', is_status_believable),
+    ( 'Bells', 'bells', 'bells', is_eq ),
+    ( 'Type', 'ring_type', 'ringtype', is_type_eq ),
+    # Weight
+    #( 'Note', 'eda.Note', 'dove.Note', is_eq ),
+    ( 'GF' , 'gf', 'gf', is_bool_eq ),
+    ( 'OSGrid', 'os_grid', 'ng', is_eq ),
+    ( 'Postcode', 'postcode', 'postcode', is_eq ),
+    # LAt
+    # Lng
+    #( 'Website', 'eda.Website', 'dove.WebPage', web_page_eq ),
+    ( 'TowerbaseID', 'towerbase_id', 'towerbase', is_eq )
+    )
+
+# Every test label, in the order findings are listed
+LABELS = ['RingID'] + [label for (label, us, them, fn) in TESTS] + ['Diocese', 'Affiliation']
+
+# The fields compared, ours and Dove's
+TOWER_FIELDS = ['dove_ringid'] + [us for (label, us, them, fn) in TESTS]
+DOVE_COLUMNS = ['ringid', 'diocese', 'affiliations'] + [them for (label, us, them, fn) in TESTS]
+
+
+def check(tower, dove_tower, do_this=lambda test: True):
+
+    """
+    [(test label, our value, Dove's value), ...] for each difference
+    between a tower and its Dove entry (None if it wasn't found)
+    """
+
+    if dove_tower is None:
+        return [('RingID', tower.dove_ringid, '')]
+
+    found = []
+    for (label, us, them, fn) in TESTS:
+        if do_this(label):
+            if not fn(getattr(tower, us), getattr(dove_tower, them)):
+                found.append((label, getattr(tower, us), getattr(dove_tower, them)))
+
+    if do_this('Diocese'):
+        if 'Ely' not in dove_tower.diocese.split(';'):
+            found.append(('Diocese', 'Ely', dove_tower.diocese))
+
+    # Dove normally only list Affiliation for Bells >= 4 and it only matters for
+    # Full-circle rings
+    if do_this('Affiliation'):
+        if (int(dove_tower.bells) >= 4 and
+            dove_tower.ringtype == 'Full-circle ring' and
+            'Ely Diocesan Association' not in dove_tower.affiliations.split(';')):
+            found.append(('Affiliation', 'Ely Diocesan Association', dove_tower.affiliations))
+
+    # As stored, so that they compare equal to ReconcileIssues read back
+    return [(label, '' if ours is None else str(ours), '' if theirs is None else str(theirs))
+            for label, ours, theirs in found]
+
+
+def describe(label, ours, theirs):
+    """The line reconsile_with_dove prints for a finding"""
+    if label == 'RingID':
+        return f"[RingID] '{ours}' not found"
+    if label == 'Diocese':
+        return f"[Diocese] 'Ely' not fonud in Dove Diocese '{theirs}'"
+    if label == 'Affiliation':
+        return f"[Affiliation] 'Ely Diocesan Association' not found in Dove Affiliations :'{theirs}'"
+    return f"[{label}] us: '{ours}', them: '{theirs}'"
+
+
+def values_hash(values):
+    return hashlib.sha1(repr((CHECKS_VERSION, *values)).encode()).hexdigest()
+
+
+def tower_hash(tower):
+    return values_hash(getattr(tower, field) for field in TOWER_FIELDS)
+
+
+def dove_hash(dove_tower):
+    if dove_tower is None:
+        return ''
+    return values_hash(getattr(dove_tower, column) for column in DOVE_COLUMNS)
+
+
+@transaction.atomic
+def reconcile(towers, get_dove, full=False):
+
+    """
+    Check the towers whose own values, or their Dove entry's (from
+    get_dove(ringid)), have changed since they were last checked (or all
+    of them, if full), and bring their ReconcileIssues up to date: open
+    ones for new findings, and resolved_at set on those no longer found.
+    Returns the number of towers checked.
+    """
+
+    now = timezone.now()
+    checks = ReconcileCheck.objects.in_bulk([tower.pk for tower in towers])
+
+    changed = {}
+    for tower in towers:
+        dove_tower = get_dove(tower.dove_ringid)
+        hashes = (tower_hash(tower), dove_hash(dove_tower))
+        last = checks.get(tower.pk)
+        if full or last is None or (last.tower_hash, last.dove_hash) != hashes:
+            changed[tower.pk] = (tower, dove_tower, hashes)
+
+    # Keep well inside SQLite's limit on query parameters
+    pks = list(changed)
+    open_issues = {}
+    for start in range(0, len(pks), 900):
+        for issue in ReconcileIssue.objects.filter(tower__in=pks[start:start + 900], resolved_at__isnull=True):
+            open_issues[(issue.tower_id, issue.test, issue.ours, issue.theirs)] = issue.pk
+
+    new = []
+    for pk, (tower, dove_tower, hashes) in changed.items():
+        for label, ours, theirs in check(tower, dove_tower):
+            if open_issues.pop((pk, label, ours, theirs), None) is None:
+                new.append(ReconcileIssue(tower=tower, test=label, ours=ours, theirs=theirs, first_seen=now))
+
+    # Whatever is left wasn't found this time
+    resolved = list(open_issues.values())
+    for start in range(0, len(resolved), 900):
+        ReconcileIssue.objects.filter(pk__in=resolved[start:start + 900]).update(resolved_at=now)
+    ReconcileIssue.objects.bulk_create(new)
+    ReconcileCheck.objects.bulk_create(
+        [ReconcileCheck(tower=tower, tower_hash=hashes[0], dove_hash=hashes[1], checked_at=now)
+         for tower, dove_tower, hashes in changed.values()],
+        update_conflicts=True, unique_fields=['tower'], update_fields=['tower_hash', 'dove_hash', 'checked_at'])
+
+    return len(changed)
@@ -0,0 +1,146 @@
+from django.core.cache import caches
+from django.db.models import OuterRef, Subquery
+from django.utils.html import format_html, format_html_join
+
+from io import StringIO
+from itertools import groupby
+import csv
+import re
+
+from .models import Contact, Tower
+
+# Change this when the way entries are rendered changes, so that cached
+# entries aren't used
+RENDER_VERSION = 2
+
+FORMATS = ('html', 'markdown', 'csv')
+
+CSV_COLUMNS = ['District', 'Place', 'Dedication', 'Bells', 'Weight', 'Note', 'Ground floor',
+               'Service', 'Practice', 'Contact', 'Phone', 'Phone 2', 'Email', 'Peals', 'Notes']
+
+MARKDOWN_SPECIAL = re.compile(r'([\\`*_\[\]#<>|])')
+
+
+def latest_history_id(model, pk):
+    """A subquery for the id of the newest historical record of the model object with primary key pk"""
+    return Subquery(model.history.model.objects.filter(id=OuterRef(pk)).order_by('-history_id').values('history_id')[:1])
+
+
+def report_towers():
+
+    """
+    The towers in the Annual Report, in order, with their primary contacts
+    and the ids of the latest historical records of both, in one query
+    """
+
+    return (Tower.objects.filter(report=True)
+            .select_related('primary_contact')
+            .annotate(tower_version=latest_history_id(Tower, 'pk'),
+                      contact_version=latest_history_id(Contact, 'primary_contact'))
+            .order_by('district', 'place', 'dedication'))
+
+
+def entry_values(tower):
+
+    """
+    The title, bells description and (label, value) details of one tower's
+    entry, common to every format
+    """
+
+    title = f'{tower.place}, {tower.dedication}' if tower.include_dedication else tower.place
+    if tower.nickname:
+        title += f' ({tower.nickname})'
+
+    bells = f'{tower.bells} bells' if tower.bells else ''
+    if tower.weight:
+        bells += f', {tower.weight}'
+    if tower.note:
+        bells += f' in {tower.note}'
+    if tower.gf:
+        bells += ' (ground floor)'
+
+    details = [('Service', tower.service), ('Practice', tower.practice)]
+
+    contact = tower.primary_contact
+    if contact and tower.contact_use != Tower.ContactUses.NONE:
+        label = 'Contact' if tower.contact_use == Tower.ContactUses.ALL else f'Contact ({tower.contact_use.lower()})'
+        details.append((label, ', '.join(v for v in (contact.name, contact.phone, contact.phone2, contact.email) if v)))
+
+    if tower.peals:
+        details.append(('Peals', str(tower.peals)))
+    details.append(('Notes', tower.notes))
+
+    return title, bells, [(label, value) for label, value in details if value]
+
+
+def render_html(tower):
+    title, bells, details = entry_values(tower)
+    return format_html('<div class="tower">\n<h3>{}</h3>\n<p>{}</p>\n<dl>\n{}</dl>\n</div>\n', title, bells,
+                       format_html_join('', '<dt>{}</dt><dd>{}</dd>\n', details))
+
+
+def render_markdown(tower):
+    title, bells, details = entry_values(tower)
+    escape = lambda text: MARKDOWN_SPECIAL.sub(r'\\\1', text)
+    lines = [f'### {escape(title)}', '']
+    if bells:
+        lines += [escape(bells), '']
+    lines += [f'- **{label}:** {escape(value)}' for label, value in details]
+    return '\n'.join(lines) + '\n\n'
+
+
+def render_csv(tower):
+    contact = tower.primary_contact if tower.contact_use != Tower.ContactUses.NONE else None
+    out = StringIO()
+    csv.writer(out).writerow([
+        tower.get_district_display(), tower.place, tower.dedication, tower.bells or '', tower.weight, tower.note,
+        'Yes' if tower.gf else '', tower.service, tower.practice,
+        contact.name if contact else '', contact.phone if contact else '', contact.phone2 if contact else '',
+        contact.email if contact else '',
+        tower.peals or '', tower.notes])
+    return out.getvalue()
+
+
+RENDERERS = {'html': render_html, 'markdown': render_markdown, 'csv': render_csv}
+
+
+def district_heading(district, fmt):
+    if fmt == 'html':
+        return format_html('<h2>{}</h2>\n', district)
+    if fmt == 'markdown':
+        return f'## {district}\n\n'
+    return ''
+
+
+def generate_report(fmt):
+
+    """
+    The Annual Report tower listing in fmt ('html', 'markdown' or 'csv'),
+    grouped by district. Each tower's entry is cached (in the 'reports'
+    cache) against the latest historical records of the tower and its
+    primary contact, so only towers edited since the last run are rendered
+    again. Returns the report and the number of entries rendered and
+    taken from the cache.
+    """
+
+    cache = caches['reports']
+    towers = list(report_towers())
+    keys = {tower.pk: f'report-{RENDER_VERSION}-{fmt}-{tower.pk}-{tower.tower_version}-{tower.contact_version}'
+            for tower in towers}
+    cached = cache.get_many(keys.values())
+
+    rendered = {}
+    parts = [','.join(CSV_COLUMNS) + '\r\n'] if fmt == 'csv' else []
+    for district, group in groupby(towers, key=lambda tower: tower.get_district_display()):
+        parts.append(district_heading(district, fmt))
+        for tower in group:
+            key = keys[tower.pk]
+            entry = cached.get(key)
+            if entry is None:
+                entry = rendered[key] = RENDERERS[fmt](tower)
+            parts.append(entry)
+
+    if rendered:
+        cache.set_many(rendered)
+
+    return ''.join(parts), len(rendered), len(towers) - len(rendered)
@@ -0,0 +1,190 @@
+from django.db import connection, transaction
+from django.db.models import IntegerField, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from unidecode import unidecode
+import re
+
+from .dedications import dove_dedication
+from .models import DoveRing, SearchWord, Tower
+
+# Text indexed for each kind of object: the model, the fields to read and
+# a function turning those values into searchable text. The Dove-style
+# form of our dedications is included so that e.g. 'S Mary' or 'Bapt'
+# find them too.
+
+SOURCES = {
+    'tower': (Tower, ('pk', 'place', 'dedication', 'full_dedication', 'nickname'),
+              lambda v: ' '.join((v['place'], v['dedication'], v['full_dedication'], v['nickname'], dove_dedication(v['dedication'])))),
+    'dove': (DoveRing, ('pk', 'place', 'place2', 'dedicn', 'barededicn', 'altname', 'towerid', 'ringid'),
+             lambda v: ' '.join(str(v[f]) for f in ('place', 'place2', 'dedicn', 'barededicn', 'altname', 'towerid', 'ringid'))),
+}
+
+WORD_PATTERN = re.compile(r'\w+')
+
+_fts5 = None
+
+
+def fold(text):
+    """Accent-folded, lower case words of text"""
+    return WORD_PATTERN.findall(unidecode(text).lower())
+
+
+def use_fts5():
+
+    """
+    True if the database is SQLite with FTS5 compiled in; otherwise the
+    SearchWord table is used
+    """
+
+    global _fts5
+    if _fts5 is None:
+        _fts5 = False
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA compile_options")
+                _fts5 = 'ENABLE_FTS5' in {row[0] for row in cursor.fetchall()}
+    return _fts5
+
+
+def fts_table(kind):
+    return f'search_{kind}_fts'
+
+
+def index_objects(kind, pks=None):
+
+    """
+    (Re-)index the objects of one kind with the given primary keys, or all
+    of them if pks is None. Objects that no longer exist are removed.
+    """
+
+    model, fields, text = SOURCES[kind]
+    objects = model.objects.order_by()
+    if pks is not None:
+        pks = list(pks)
+        objects = objects.filter(pk__in=pks)
+    entries = [(v['pk'], ' '.join(fold(text(v)))) for v in objects.values(*fields)]
+
+    with transaction.atomic():
+        if use_fts5():
+            with connection.cursor() as cursor:
+                if pks is None:
+                    cursor.execute(f"DELETE FROM {fts_table(kind)}")
+                else:
+                    cursor.executemany(f"DELETE FROM {fts_table(kind)} WHERE rowid = %s", [(pk,) for pk in pks])
+                cursor.executemany(f"INSERT INTO {fts_table(kind)} (rowid, text) VALUES (%s, %s)",
+                                   entries)
+        else:
+            old = SearchWord.objects.filter(kind=kind)
+            if pks is not None:
+                old = old.filter(object_id__in=[str(pk) for pk in pks])
+            old.delete()
+            SearchWord.objects.bulk_create(
+                [SearchWord(kind=kind, object_id=str(pk), word=word[:100]) for pk, words in entries for word in set(words.split())],
+                batch_size=1000)
+
+    return len(entries)
+
+
+def update_index(kind, pks):
+
+    """
+    Re-index some objects, building the whole index if there isn't one yet
+    (so that an index is never partial)
+    """
+
+    if is_indexed(kind):
+        index_objects(kind, pks)
+    else:
+        index_objects(kind)
+
+
+def remove_from_index(kind, pks):
+    """Remove the objects of one kind with the given primary keys from the index"""
+    if use_fts5():
+        with connection.cursor() as cursor:
+            cursor.executemany(f"DELETE FROM {fts_table(kind)} WHERE rowid = %s", [(pk,) for pk in pks])
+    else:
+        SearchWord.objects.filter(kind=kind, object_id__in=[str(pk) for pk in pks]).delete()
+
+
+def is_indexed(kind):
+
+    if use_fts5():
+        with connection.cursor() as cursor:
+            cursor.execute(f"SELECT 1 FROM {fts_table(kind)} LIMIT 1")
+            return cursor.fetchone() is not None
+    return SearchWord.objects.filter(kind=kind).exists()
+
+
+def alternatives(term):
+    """The words of term to search for, accent-folded and as typed or converted to Dove style"""
+    found = {tuple(fold(term)), tuple(fold(dove_dedication(term, ignore_case=True)))}
+    found.discard(())
+    return found
+
+
+def fts_query(words_list):
+    return ' OR '.join('(' + ' '.join(f'"{word}"*' for word in words) + ')' for words in words_list)
+
+
+def matching(kind, term):
+
+    """
+    A Q object selecting the objects of one kind matching every word of
+    term as a prefix (see search()), as a subquery against the index so
+    that the matching primary keys are never fetched. Returns None if
+    there is no index to search.
+    """
+
+    if not is_indexed(kind):
+        return None
+
+    words_list = alternatives(term)
+    if not words_list:
+        return Q(pk__in=[])
+
+    if use_fts5():
+        return Q(pk__in=RawSQL(f"SELECT rowid FROM {fts_table(kind)} WHERE {fts_table(kind)} MATCH %s",
+                               [fts_query(words_list)]))
+
+    q = Q(pk__in=[])
+    for words in words_list:
+        all_words = Q()
+        for word in words:
+            # A range, rather than LIKE, so that the (kind, word) index is used
+            all_words &= Q(pk__in=SearchWord.objects.filter(kind=kind, word__gte=word, word__lt=word + '\uffff')
+                           .values(object_pk=Cast('object_id', IntegerField())))
+        q |= all_words
+    return q
+
+
+def search(kind, term, limit=None):
+
+    """
+    Primary keys of the objects of one kind matching every word of term as
+    a prefix (after accent folding and, as an alternative, conversion to
+    Dove style), in no particular order. Returns None if there is no index
+    to search.
+    """
+
+    if not is_indexed(kind):
+        return None
+
+    words_list = alternatives(term)
+    if not words_list:
+        return []
+
+    if use_fts5():
+        # Not ORDER BY rank, which would have to score every match and so
+        # get slower as the table grows
+        sql = f"SELECT rowid FROM {fts_table(kind)} WHERE {fts_table(kind)} MATCH %s"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [fts_query(words_list)])
+            return [row[0] for row in cursor.fetchall()]
+
+    pks = SOURCES[kind][0].objects.filter(matching(kind, term)).order_by('pk').values_list('pk', flat=True)
+    return list(pks[:limit] if limit else pks)
@@ -0,0 +1,80 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from simple_history.signals import post_create_historical_record
+
+from contextlib import contextmanager
+import threading
+
+from .api import queue_data_version_bump
+from .history import record_tower_change
+from .models import Contact, ContactMap, PracticeSlot, Tower, Website
+from .search import remove_from_index, update_index
+
+_state = threading.local()
+
+
+@contextmanager
+def row_updates_suspended():
+
+    """
+    Turn off the handlers below, which keep practice slots, the search
+    index, TowerChanges and the data version up to date a row at a time,
+    for bulk changes that bring them all up to date in one go afterwards
+    """
+
+    suspended = getattr(_state, 'suspended', False)
+    _state.suspended = True
+    try:
+        yield
+    finally:
+        _state.suspended = suspended
+
+
+def is_suspended():
+    return getattr(_state, 'suspended', False)
+
+
+@receiver(post_save, sender=Tower)
+def update_practice_slots(sender, instance, raw=False, **kwargs):
+    if raw or is_suspended():
+        return
+    with transaction.atomic():
+        instance.practice_slots.all().delete()
+        PracticeSlot.objects.bulk_create(instance.get_practice_slots())
+
+
+@receiver(post_save, sender=Tower)
+def update_search_index(sender, instance, raw=False, **kwargs):
+    if raw or is_suspended():
+        return
+    update_index('tower', [instance.pk])
+
+
+@receiver(post_delete, sender=Tower)
+def remove_from_search_index(sender, instance, **kwargs):
+    if is_suspended():
+        return
+    remove_from_index('tower', [instance.pk])
+
+
+@receiver(post_create_historical_record, sender=Tower.history.model)
+def update_tower_changes(sender, history_instance, **kwargs):
+    if is_suspended():
+        return
+    record_tower_change(history_instance)
+
+
+@receiver(post_save, sender=Tower)
+@receiver(post_save, sender=Contact)
+@receiver(post_save, sender=ContactMap)
+@receiver(post_save, sender=Website)
+@receiver(post_delete, sender=Tower)
+@receiver(post_delete, sender=Contact)
+@receiver(post_delete, sender=ContactMap)
+@receiver(post_delete, sender=Website)
+def update_data_version(sender, instance, raw=False, **kwargs):
+    if is_suspended():
+        return
+    queue_data_version_bump()
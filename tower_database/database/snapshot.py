@@ -0,0 +1,105 @@
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+import csv
+import datetime
+
+from .history import tracked_fields
+from .models import Contact, ContactMap, Tower, Website
+
+# What a snapshot contains, by name
+TABLES = {
+    'towers': Tower,
+    'contacts': Contact,
+    'contact_maps': ContactMap,
+    'websites': Website,
+}
+
+# Rows fetched from the database at a time
+CHUNK_SIZE = 1000
+
+
+def columns(model):
+    return [model._meta.pk.attname, *tracked_fields(model)]
+
+
+def as_of(model, when):
+
+    """
+    Yield a dict of the values of every model object that existed at when
+    (an aware datetime), as its historical records say it was then. One
+    query, picking the latest record of each object at or before when.
+    """
+
+    pk = model._meta.pk.attname
+    latest = (model.history.model.objects
+              .filter(history_date__lte=when)
+              .annotate(version=Window(RowNumber(), partition_by=F(pk),
+                                       order_by=[F('history_date').desc(), F('history_id').desc()]))
+              .filter(version=1)
+              .order_by(pk)
+              .values('history_type', *columns(model)))
+
+    for record in latest.iterator(chunk_size=CHUNK_SIZE):
+        # Deleted by then (filtering this out in the query would find the
+        # version before the deletion instead)
+        if record.pop('history_type') != '-':
+            yield record
+
+
+class Echo:
+    """Just enough of a file for csv.writer to hand back each line"""
+    def write(self, value):
+        return value
+
+
+def export_csv(when, table):
+    """Yield the lines of a CSV file of one table as of when"""
+    model = TABLES[table]
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns(model))
+    for record in as_of(model, when):
+        # Multiple choice fields as they are stored, e.g. '2nd,4th'
+        yield writer.writerow(','.join(v) if isinstance(v, list) else v for v in record.values())
+
+
+def export_json(when, tables=None):
+
+    """
+    Yield, in pieces, a JSON object with the time of the snapshot and a list
+    of the objects in each table (by default all of them) as of when
+    """
+
+    encoder = DjangoJSONEncoder()
+    yield '{"as_of": ' + encoder.encode(when)
+    for table in tables or TABLES:
+        yield f',\n"{table}": ['
+        separator = '\n'
+        for record in as_of(TABLES[table], when):
+            yield separator + encoder.encode(record)
+            separator = ',\n'
+        yield '\n]'
+    yield '}\n'
+
+
+def parse_when(text):
+
+    """
+    An aware datetime from 'YYYY-MM-DD' (the end of that day) or an ISO
+    date and time, in the current time zone unless it says otherwise, or
+    None if text is neither
+    """
+
+    try:
+        day = parse_date(text)
+        when = datetime.datetime.combine(day, datetime.time.max) if day else parse_datetime(text)
+    except ValueError:
+        return None
+    if when is None:
+        return None
+    if timezone.is_naive(when):
+        when = timezone.make_aware(when)
+    return when
@@ -1,3 +1,991 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from types import SimpleNamespace
+import csv
+import datetime
+import hashlib
+import itertools
+import math
+import os
+import random
+import shutil
+import tempfile
+import threading
+
+from .api import data_version
+from .calendar import month_table, practices_between
+from .dedications import dove_dedication
+from .dove_match import apply_matches, is_confident, suggest_matches
+from .fetch import commit, fetch
+from .geo import GridIndex, distance_matrix, haversine
+from .history import Policy, versions_to_drop
+from .management.commands.reload_data import parse_row
+from .models import Contact, ContactMap, DoveRing, DoveTower, PracticeSlot, ReconcileIssue, Tower, TowerChange, Website
+from .osgrid import grid_refs_to_wgs84
+from .reconcile import reconcile
+from .report import CSV_COLUMNS, render_csv
+from .search import search, use_fts5
+from .snapshot import as_of, export_csv
+from .tours import nearest_neighbour, or_opt, plan_tour, route_length, two_opt
+from .validation import EXCLUDE, duplicate_towers, validate_tower
 
 # Create your tests here.
+
+class StandInHandler(BaseHTTPRequestHandler):
+
+    """
+    Serves self.server.body, optionally with an ETag, honouring
+    If-None-Match and Range/If-Range
+    """
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        body = server.body
+        etag = f'"{hashlib.md5(body).hexdigest()}"' if server.use_etag else None
+
+        if etag and self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start = 0
+        range_header = self.headers.get('Range')
+        if etag and range_header and self.headers.get('If-Range') == etag:
+            start = int(range_header.removeprefix('bytes=').rstrip('-'))
+
+        self.send_response(206 if start else 200)
+        if etag:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+        self.wfile.write(body[start:])
+
+    def log_message(self, *args):
+        pass
+
+
+class FetchTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+        self.server.body = b'Place,Dedication\r\nAbbotsley,St Margaret\r\n'
+        self.server.use_etag = True
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/towers.csv'
+        self.cache = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.cache.cleanup()
+
+    def fetch(self, **kwargs):
+        # As if the file was then imported successfully
+        fetched = fetch(self.url, cache_dir=self.cache.name, **kwargs)
+        if fetched:
+            commit(fetched)
+            return fetched.path
+
+    def test_unchanged_by_etag(self):
+        path = self.fetch()
+        self.assertEqual(path.read_bytes(), self.server.body)
+        self.assertIsNone(self.fetch())
+        self.assertEqual(self.server.requests[-1]['If-None-Match'], f'"{hashlib.md5(self.server.body).hexdigest()}"')
+        self.assertEqual(self.fetch(force=True), path)
+
+    def test_unchanged_by_hash(self):
+        self.server.use_etag = False
+        self.assertIsNotNone(self.fetch())
+        self.assertIsNone(self.fetch())
+        self.server.body += b'Balsham,Holy Trinity\r\n'
+        self.assertEqual(self.fetch().read_bytes(), self.server.body)
+
+    def test_failed_import(self):
+        self.fetch()
+        self.server.body += b'Balsham,Holy Trinity\r\n'
+        # Importing the new version fails, so it isn't committed
+        fetch(self.url, cache_dir=self.cache.name)
+        self.assertEqual(self.fetch().read_bytes(), self.server.body)
+        self.assertIsNone(self.fetch())
+
+    def test_resume(self):
+        # Simulate a download that was interrupted after the first 10 bytes
+        self.fetch()
+        data = next(Path(self.cache.name).glob('*.data'))
+        data.unlink()
+        data.with_suffix('.part').write_bytes(self.server.body[:10])
+        data.with_suffix('.json').rename(data.with_suffix('.part.json'))
+
+        self.assertEqual(self.fetch().read_bytes(), self.server.body)
+        self.assertEqual(self.server.requests[-1]['Range'], 'bytes=10-')
+
+
+class ValidationTests(TestCase):
+
+    """
+    validate_tower() finds the same problems as full_clean(), and
+    duplicate_towers() the same as the unique_place_dedication constraint
+    """
+
+    CASES = (
+        {},
+        {'district': 'Q', 'county': 'Nowhere', 'place': ''},
+        {'bells': 0, 'weight': 'heavy', 'note': 'H', 'os_grid': 'XX', 'postcode': 'CB1'},
+        {'lat': '152.2345', 'lng': 'east', 'full_dedication': 'x' * 101},
+        {'practice': 'wednesday at 7.30pm', 'service': 'Sunday 10.00', 'practice_day': 'Fri', 'practice_weeks': ['1st', 'Alt']},
+        {'ringing_status': 'N', 'practice': 'Wednesday 19:30', 'practice_day': 'Wed', 'travel_check': True},
+    )
+
+    def test_validate_tower(self):
+        for values in self.CASES:
+            with self.subTest(**values):
+                tower = Tower(**{'place': 'Here', 'dedication': 'St Mary', 'district': 'E', **values})
+                try:
+                    tower.full_clean(exclude=EXCLUDE, validate_unique=False, validate_constraints=False)
+                    expected = set()
+                except ValidationError as e:
+                    expected = {(field, message) for field, messages in e.message_dict.items() for message in messages}
+                self.assertEqual({(field, message) for field, rule, message in validate_tower(tower)}, expected)
+
+    def test_duplicate_towers(self):
+        Tower.objects.create(place='Here', dedication='St Mary', district='E')
+        twin = Tower(place='Here', dedication='St Mary', district='E')
+        with self.assertRaises(ValidationError) as raised:
+            twin.validate_constraints()
+        messages = [message for messages in raised.exception.message_dict.values() for message in messages]
+
+        towers = list(Tower.objects.all()) + [twin, Tower(place='There', dedication='St Mary', district='E')]
+        found = duplicate_towers(towers)
+        self.assertEqual([error['id'] for error in found], [towers[0].pk, None])
+        self.assertEqual({error['message'] for error in found}, set(messages))
+
+
+class DoveDedicationTests(SimpleTestCase):
+
+    """
+    Dedications convert to Dove style as they did before the conversion
+    moved out of reconsile_with_dove
+    """
+
+    CASES = (
+        ('St Mary the Great', 'S Mary Gt'),
+        ('St Mary Magdalene', 'S Mary Magd'),
+        ('St Mary the Virgin', 'S Mary V'),
+        ('St Mary the Blessed Virgin', 'S Mary BV'),
+        ('St John the Baptist', 'S John Bapt'),
+        ('St John the Evangelist', 'S John Ev'),
+        ('The Church of the Blessed Virgin Mary', 'Church of BVM'),
+        ('St Michael and All Angels and the Holy Host of Heaven', 'S Michael & All Angels'),
+        ('Cathedral Church of the Holy and Undivided Trinity', 'Cath Ch of Holy & Undivided Trinity'),
+        ('Our Lady and the English Martyrs', 'Our Lady & Eng Martyrs'),
+        ('St Edmund King and Martyr', 'S Edmund K&M'),
+        ('St Peter and St Paul', 'S Peter & S Paul'),
+        ('St Ætheldreda', 'S AEtheldreda'),
+        ('Stapleford', 'Stapleford'),
+        ('All Saints', 'All Saints'),
+    )
+
+    def test_conversions(self):
+        for eda, dove in self.CASES:
+            with self.subTest(eda):
+                self.assertEqual(dove_dedication(eda), dove)
+
+
+class TowerCleanTests(SimpleTestCase):
+
+    """
+    Tower.clean() finds the same problems as it did before it scanned the
+    practice text only once
+    """
+
+    CASES = (
+        (dict(ringing_status='N', service='Sunday 10:00'),
+         {'ringing_status': ['Iinconsistent with Service or Practice']}),
+        (dict(practice='Wednesday 19:30', practice_day='Wed'), {}),
+        (dict(practice='Wednesday 19:30', practice_day='Thu'), {'practice_day': ['Inconsistent with Practice']}),
+        (dict(practice='Wednesday 19:30'), {'practice_day': ['Inconsistent with Practice']}),
+        (dict(practice='Wednesday 19:30 (check)', practice_day='Wed'), {'travel_check': ["Practice mentions 'check'"]}),
+        (dict(practice='Wednesday 19:30 (check)', practice_day='Wed', travel_check=True), {}),
+        (dict(practice='Wednesday 19:30', practice_day='Wed', travel_check=True),
+         {'travel_check': ["Practice doesn't mention 'check'"]}),
+        (dict(practice='1st and 3rd Wednesday 19:30', practice_day='Wed', practice_weeks=['1st']),
+         {'practice_weeks': ["'3rd' appears in in Practice"]}),
+        (dict(practice='1st Wednesday 19:30', practice_day='Wed', practice_weeks=['1st', '2nd']),
+         {'practice_weeks': ["'2nd' doesn't appear in Practice"]}),
+    )
+
+    def test_clean(self):
+        for values, errors in self.CASES:
+            with self.subTest(**values):
+                tower = Tower(place='Here', dedication='St Mary', **{'ringing_status': 'R', **values})
+                try:
+                    tower.clean()
+                    found = {}
+                except ValidationError as e:
+                    found = e.message_dict
+                self.assertEqual(found, errors)
+
+
+class OSGridTests(SimpleTestCase):
+
+    def test_grid_refs_to_wgs84(self):
+        # Oakington, and Ben Nevis (in a different 500km square)
+        oakington, ben_nevis, bad, blank = grid_refs_to_wgs84(['TL 414 647', 'NN166712', 'XX123456', ''])
+        self.assertAlmostEqual(oakington[0], 52.263, places=3)
+        self.assertAlmostEqual(oakington[1], 0.071, places=3)
+        self.assertAlmostEqual(ben_nevis[0], 56.797, places=3)
+        self.assertAlmostEqual(ben_nevis[1], -5.004, places=3)
+        self.assertEqual((bad, blank), (None, None))
+
+
+class PracticeSlotTests(SimpleTestCase):
+
+    def test_range_ends_are_not_starts(self):
+        tower = Tower(practice_day='Wed', practice='Wednesday 18:00-18:30 (learners), then 18:30-19:30')
+        self.assertEqual(sorted({slot.start for slot in tower.get_practice_slots()}),
+                         [datetime.time(18, 0), datetime.time(18, 30)])
+
+    def test_separate_times(self):
+        tower = Tower(practice_day='Fri', practice='Friday 19:30 or 20.00 to 21.00')
+        self.assertEqual(sorted({slot.start for slot in tower.get_practice_slots()}),
+                         [datetime.time(19, 30), datetime.time(20, 0)])
+
+
+def master_list_row(**values):
+    """A row of the master list, as csv.DictReader reads it, for a made-up tower"""
+    row = dict.fromkeys(['Place', 'County', 'Dedication', 'Full dedication', 'Nickname', 'District', 'Include dedication',
+                         'Status', 'Report', 'Service', 'Practice', 'Day', 'Week', 'Check', 'Bells', 'Type', 'Weight',
+                         'Note', 'GF', 'OS grid', 'Postcode', 'Lng', 'Lat', 'Website', 'Picture', 'Picture credit',
+                         'Secretary', 'Phone', 'Email', 'Band contact', 'Bells contact', 'Peals', 'Dove Tower ID',
+                         'TowerBase ID', 'Notes', 'Longer notes', 'Maintainer notes', 'ID', 'Dove Ring ID'], '')
+    row.update({'Place': 'Oakington', 'County': 'Cambridgeshire', 'Dedication': 'St Andrew', 'District': 'Ely',
+                'Status': 'Regular ringing', 'Practice': 'Wednesday 18:00-19:30', 'Day': 'Wednesday', 'Bells': '6',
+                'Type': 'Full-circle ring', 'OS grid': 'TL414647', 'Lng': '0.072', 'Lat': '52.263',
+                'Secretary': 'Secretary', 'Email': 'secretary@example.com', 'Band contact': 'Yes',
+                'Dove Tower ID': '15878', 'Dove Ring ID': '5879', **values})
+    return row
+
+
+class PracticeCalendarTests(TestCase):
+
+    """
+    Practices land on the right days of the month, whether every week,
+    numbered weeks, all but some weeks or alternate weeks, and the
+    calendar follows changes to the towers
+    """
+
+    def setUp(self):
+        caches['default'].clear()
+
+        def tower(place, day, weeks):
+            return Tower.objects.create(place=place, dedication='St Mary', district='E', practice_day=day,
+                                        practice=f'{Tower.Days(day).label} 19:30', practice_weeks=weeks)
+
+        self.second = tower('Second', 'Wed', ['2nd'])
+        self.alternate = tower('Alternate', 'Wed', ['Alt'])
+        self.not_first = tower('Not first', 'Wed', ['Not', '1st'])
+        self.weekly = tower('Weekly', 'Tue', [])
+
+    def days(self, start, end):
+        return {date.day: set(ids) for date, ids in practices_between(start, end)}
+
+    def test_month_table(self):
+        # October 2025 starts on a Wednesday
+        table = month_table(2025, 10)
+        self.assertEqual(table[(2, 1)], 1 << 0)
+        self.assertEqual(table[(2, 5)], 1 << 28)
+        self.assertEqual(table[(1, 1)], 1 << 6)
+        self.assertNotIn((1, 5), table)
+        self.assertEqual(table[(2, None)], sum(1 << (day - 1) for day in (1, 8, 15, 22, 29)))
+
+    def test_weeks(self):
+        days = self.days(datetime.date(2025, 10, 1), datetime.date(2025, 10, 31))
+        self.assertEqual(days[1], {self.alternate.pk})
+        self.assertEqual(days[7], {self.weekly.pk})
+        self.assertEqual(days[8], {self.second.pk, self.alternate.pk, self.not_first.pk})
+        self.assertEqual(days[29], {self.alternate.pk, self.not_first.pk})
+        self.assertEqual(days[30], set())
+
+    def test_month_boundary(self):
+        dates = practices_between(datetime.date(2025, 10, 28), datetime.date(2025, 11, 5))
+        self.assertEqual(len(dates), 9)
+        self.assertEqual((dates[0][0], dates[-1][0]), (datetime.date(2025, 10, 28), datetime.date(2025, 11, 5)))
+        days = {date: set(ids) for date, ids in dates}
+        self.assertEqual(days[datetime.date(2025, 10, 29)], {self.alternate.pk, self.not_first.pk})
+        self.assertEqual(days[datetime.date(2025, 11, 4)], {self.weekly.pk})
+        self.assertEqual(days[datetime.date(2025, 11, 5)], {self.alternate.pk})
+
+    def test_tower_saved(self):
+        october = (datetime.date(2025, 10, 1), datetime.date(2025, 10, 31))
+        self.assertNotIn(self.second.pk, self.days(*october)[1])
+        self.second.practice_weeks = ['1st']
+        self.second.save()
+        days = self.days(*october)
+        self.assertIn(self.second.pk, days[1])
+        self.assertNotIn(self.second.pk, days[8])
+
+    def test_view(self):
+        response = self.client.get(reverse('database:practices') + '?date=2025-10-08')
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(sorted(data['dates'][0]['towers']), sorted([self.second.pk, self.alternate.pk, self.not_first.pk]))
+        self.assertTrue(data['towers'][str(self.alternate.pk)]['check'])
+        self.assertFalse(data['towers'][str(self.second.pk)]['check'])
+
+    def test_bad_requests(self):
+        for query in ('', '?date=tomorrow', '?start=2025-10-01', '?start=2025-10-08&end=2025-10-01',
+                      '?start=2025-01-01&end=2026-01-02'):
+            with self.subTest(query):
+                self.assertEqual(self.client.get(reverse('database:practices') + query).status_code, 400)
+
+
+class ParseRowTests(SimpleTestCase):
+
+    def test_lat_lng(self):
+        values, contact, website = parse_row(master_list_row())
+        self.assertEqual((values['lat'], values['lng']), ('52.263', '0.072'))
+
+
+class ReloadTestCase(TestCase):
+
+    """Loads two towers from a master list CSV file with reload_data"""
+
+    options = {}
+
+    def setUp(self):
+        self.rows = [master_list_row(Website='https://example.com/'),
+                     master_list_row(Place='Histon', Dedication='St Andrew', **{'Dove Ring ID': '2828', 'Lat': '52.252'})]
+        self.csv = tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', delete=False)
+        self.addCleanup(os.unlink, self.csv.name)
+        self.reload()
+
+    def reload(self):
+        with open(self.csv.name, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(self.rows[0]))
+            writer.writeheader()
+            writer.writerows(self.rows)
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            call_command('reload_data', file=self.csv.name, stdout=StringIO(), **self.options)
+        return [q['sql'] for q in queries if not q['sql'].startswith(('SELECT', 'SAVEPOINT', 'RELEASE'))]
+
+
+class BulkReloadTests(ReloadTestCase):
+
+    """
+    Reloading with --bulk replaces everything, and brings practice slots,
+    the search index, TowerChanges and the data version up to date once
+    rather than a row at a time
+    """
+
+    options = {'bulk': True}
+
+    def test_reload(self):
+        version = data_version()[0]
+        old = set(Tower.objects.values_list('pk', flat=True))
+        writes = self.reload()
+
+        self.assertEqual(len([sql for sql in writes if sql.startswith('UPDATE "database_dataversion"')]), 1)
+        self.assertEqual(data_version()[0], version + 1)
+
+        towers = Tower.objects.all()
+        self.assertEqual(len(towers), 2)
+        self.assertFalse(old & {tower.pk for tower in towers})
+        self.assertEqual(Contact.objects.count(), 1)
+        self.assertEqual(Website.objects.count(), 1)
+        self.assertEqual(PracticeSlot.objects.count(), sum(len(tower.get_practice_slots()) for tower in towers))
+        self.assertEqual(search('tower', 'histon'), [Tower.objects.get(place='Histon').pk])
+
+        # One TowerChange for each historical record, deletions included
+        self.assertEqual(TowerChange.objects.count(), Tower.history.count())
+        self.assertEqual(TowerChange.objects.filter(history_type='-').count(), 2)
+
+
+class IncrementalReloadTests(ReloadTestCase):
+
+    """
+    Reloading an unchanged master list with --incremental writes nothing,
+    and changing one cell updates just that field
+    """
+
+    options = {'incremental': True}
+
+    def test_unchanged(self):
+        history = Tower.history.count()
+        self.assertEqual(self.reload(), [])
+        self.assertEqual(Tower.history.count(), history)
+
+    def test_one_cell(self):
+        self.rows[1]['Bells'] = '8'
+        writes = [sql for sql in self.reload() if 'database_tower"' in sql and not sql.startswith('INSERT INTO "database_historical')]
+        self.assertEqual(len(writes), 1)
+        self.assertTrue(writes[0].startswith('UPDATE "database_tower" SET "bells" = 8 WHERE'))
+        tower = Tower.objects.get(place='Histon')
+        self.assertEqual(TowerChange.objects.filter(tower_id=tower.pk).first().changes, [['bells', 6, 8]])
+
+
+class AdminQueryCountTests(TestCase):
+
+    """
+    The admin pages should make the same number of queries however many
+    towers, contacts and links there are
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def add_towers(self, n):
+        shared = Contact.objects.create(name=f'Shared {Tower.objects.count()}')
+        for i in range(n):
+            contact = Contact.objects.create(name=f'Secretary {Contact.objects.count()}')
+            tower = Tower.objects.create(place=f'Place {Tower.objects.count()}', dedication='St Mary',
+                                         district='E', primary_contact=shared)
+            Website.objects.create(tower=tower, website=f'https://example.com/{tower.pk}')
+            ContactMap.objects.create(tower=tower, contact=contact, role='TC')
+            ContactMap.objects.create(tower=tower, contact=shared, role='RM')
+        return tower, shared
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def assertQueriesFlat(self, url_fn, expected):
+        small = url_fn(*self.add_towers(1))
+        # The first request fills some caches (e.g. ContentTypes)
+        self.count_queries(small)
+        self.assertEqual(self.count_queries(small), expected)
+        large = url_fn(*self.add_towers(20))
+        self.assertEqual(self.count_queries(large), expected)
+
+    def test_tower_changelist(self):
+        self.assertQueriesFlat(lambda tower, contact: reverse('admin:database_tower_changelist'), 6)
+
+    def test_tower_change(self):
+        self.assertQueriesFlat(lambda tower, contact: reverse('admin:database_tower_change', args=[tower.pk]), 8)
+
+    def test_contact_changelist(self):
+        self.assertQueriesFlat(lambda tower, contact: reverse('admin:database_contact_changelist'), 5)
+
+    def test_contact_change(self):
+        self.assertQueriesFlat(lambda tower, contact: reverse('admin:database_contact_change', args=[contact.pk]), 5)
+
+
+class SearchTests(TestCase):
+
+    """
+    Admin search uses the index (whose tables come from the migrations)
+    as a subquery
+    """
+
+    def test_admin_search(self):
+        mary = Tower.objects.create(place='Here', dedication='St Mary Magdalene', district='E')
+        Tower.objects.create(place='There', dedication='St Andrew', district='E')
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:database_tower_changelist') + '?q=mary+magd')
+        self.assertEqual(list(response.context['cl'].result_list), [mary])
+        self.assertEqual(any('MATCH' in query['sql'] for query in queries), use_fts5())
+
+    def test_delete(self):
+        here = Tower.objects.create(place='Here', dedication='St Mary', district='E')
+        there = Tower.objects.create(place='There', dedication='St Mary', district='E')
+        with CaptureQueriesContext(connection) as queries:
+            here.delete()
+        index = 'search_tower_fts' if use_fts5() else 'database_searchword'
+        touched = [query['sql'] for query in queries if index in query['sql']]
+        self.assertEqual(len(touched), 1)
+        self.assertIn('DELETE', touched[0])
+        self.assertEqual(search('tower', 'st mary'), [there.pk])
+
+
+class HistoryPolicyTests(SimpleTestCase):
+
+    """
+    versions_to_drop() keeps the first and last versions, real changes and
+    deletions, and collapses bursts of edits by one user
+    """
+
+    policy = Policy(max_age=None, max_versions=None, burst=datetime.timedelta(minutes=30))
+    now = datetime.datetime(2025, 6, 1, tzinfo=datetime.timezone.utc)
+
+    def records(self, *versions):
+        # (minutes after the start, type, user, value)
+        start = self.now - datetime.timedelta(days=1)
+        return [{'history_id': i, 'history_date': start + datetime.timedelta(minutes=minutes), 'history_type': kind,
+                 'history_user_id': user, 'value': value}
+                for i, (minutes, kind, user, value) in enumerate(versions, 1)]
+
+    def kept(self, records, policy=None):
+        drop = set(versions_to_drop(records, ['value'], policy or self.policy, self.now))
+        return [r['history_id'] for r in records if r['history_id'] not in drop]
+
+    def test_changes_kept(self):
+        records = self.records((0, '+', 1, 'a'), (60, '~', 1, 'b'), (120, '~', 2, 'c'), (180, '~', 1, 'd'))
+        self.assertEqual(self.kept(records), [1, 2, 3, 4])
+
+    def test_no_change_dropped(self):
+        records = self.records((0, '+', 1, 'a'), (60, '~', 1, 'a'), (120, '~', 1, 'b'))
+        self.assertEqual(self.kept(records), [1, 3])
+
+    def test_burst(self):
+        records = self.records((0, '+', 1, 'a'), (60, '~', 1, 'b'), (70, '~', 1, 'c'), (80, '~', 2, 'd'), (85, '~', 2, 'e'))
+        # Each user's burst comes down to its last edit; the first version stays
+        self.assertEqual(self.kept(records), [1, 3, 5])
+
+    def test_burst_is_measured_from_its_start(self):
+        # An edit every 20 minutes for 3 hours
+        records = self.records((0, '+', 1, 'a'), *((60 + 20 * n, '~', 1, str(n)) for n in range(10)))
+        # Bursts of two (0-20, 40-60, ...), not one that lasts all day
+        self.assertEqual(self.kept(records), [1, 3, 5, 7, 9, 11])
+
+    def test_deletion_kept(self):
+        records = self.records((0, '+', 1, 'a'), (5, '~', 1, 'b'), (10, '-', 1, 'b'))
+        self.assertEqual(self.kept(records), [1, 2, 3])
+
+    def test_limits(self):
+        records = self.records((0, '+', 1, 'a'), (60, '~', 1, 'b'), (120, '~', 1, 'c'), (180, '~', 1, 'd'))
+        self.assertEqual(self.kept(records, Policy(max_age=None, max_versions=2, burst=None)), [3, 4])
+        # Everything older than the cutoff goes, except the version current at it
+        self.assertEqual(self.kept(records, Policy(max_age=datetime.timedelta(hours=22, minutes=30),
+                                                   max_versions=None, burst=None)), [2, 3, 4])
+
+
+class TowerChangeTests(TestCase):
+
+    """
+    Each historical Tower record gets a TowerChange listing just the fields
+    that changed, and a tower's change log doesn't get slower as it grows
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def setUp(self):
+        self.tower = Tower.objects.create(place='Place', dedication='St Mary', district='E', lat='52.3863')
+
+    def edit(self, n):
+        for i in range(n):
+            self.tower.notes = f'Edit {i}'
+            self.tower.save()
+
+    def test_changes(self):
+        self.tower.bells = 8
+        # Stored as 52.386, so not a change
+        self.tower.lat = '52.386'
+        self.tower.save()
+        changes = TowerChange.objects.filter(tower_id=self.tower.pk)
+        self.assertEqual([c.history_type for c in changes], ['~', '+'])
+        self.assertEqual(changes[0].changes, [['bells', None, 8]])
+        self.assertIn(['place', None, 'Place'], changes[1].changes)
+
+    def test_change_log_queries(self):
+        self.client.force_login(self.user)
+        url = reverse('admin:database_towerchange_changelist') + f'?tower_id={self.tower.pk}'
+        counts = []
+        for n in (1, 20):
+            self.edit(n)
+            self.client.get(url)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'api': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'api-tests'},
+})
+class ApiTests(TestCase):
+
+    """
+    The tower API only shows published contacts, and answers repeat
+    requests with 304 Not Modified without querying the database until
+    something changes
+    """
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tower = Tower.objects.create(place='Place', dedication='St Mary', district='E',
+                                              primary_contact=Contact.objects.create(name='Secretary'))
+            ContactMap.objects.create(tower=self.tower, role='TC', contact=Contact.objects.create(name='Captain'))
+            ContactMap.objects.create(tower=self.tower, role='RM', publish=False,
+                                      contact=Contact.objects.create(name='Private'))
+        self.url = reverse('database:tower', args=[self.tower.pk])
+
+    def test_contacts(self):
+        contacts = self.client.get(self.url).json()['contacts']
+        self.assertEqual([c['name'] for c in contacts], ['Secretary', 'Captain'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tower.contact_use = 'None'
+            self.tower.save()
+        self.assertEqual(self.client.get(self.url).json()['contacts'], [])
+
+    def test_conditional_get(self):
+        etag = self.client.get(self.url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        # Just the data version
+        self.assertEqual(len(queries), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Website.objects.create(tower=self.tower, website='https://example.com/')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['websites'], ['https://example.com/'])
+
+
+    def test_version_survives_cache_clear(self):
+        etag = self.client.get(self.url)['ETag']
+        caches['api'].clear()
+        self.assertEqual(self.client.get(self.url)['ETag'], etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            Website.objects.create(tower=self.tower, website='https://example.com/')
+        self.assertNotEqual(self.client.get(self.url)['ETag'], etag)
+
+    def test_one_bump_per_transaction(self):
+        version = data_version()[0]
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            for n in range(3):
+                Website.objects.create(tower=self.tower, website=f'https://example.com/{n}')
+            self.tower.save()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(data_version()[0], version + 1)
+
+        # A rolled back savepoint takes its bump with it
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    self.tower.save()
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+            self.tower.save()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(data_version()[0], version + 2)
+
+
+class SnapshotTests(TestCase):
+
+    """
+    as_of() finds each object as its latest historical record at or before
+    a time says it was, and nothing for objects not yet created or already
+    deleted by then
+    """
+
+    def setUp(self):
+        self.created, self.edited, self.deleted = (datetime.datetime(2025, 1, day, 12, tzinfo=datetime.timezone.utc)
+                                                   for day in (1, 2, 3))
+        self.tower = Tower.objects.create(place='Here', dedication='St Mary', district='E', bells=6,
+                                          practice_weeks=['2nd', '4th'])
+        self.pk = self.tower.pk
+        self.tower.bells = 8
+        self.tower.save()
+        self.tower.delete()
+        for record, when in zip(Tower.history.filter(id=self.pk).order_by('history_id'),
+                                (self.created, self.edited, self.deleted)):
+            Tower.history.filter(history_id=record.history_id).update(history_date=when)
+
+    def bells(self, when):
+        return [(record['id'], record['bells']) for record in as_of(Tower, when)]
+
+    def test_as_of(self):
+        second = datetime.timedelta(seconds=1)
+        self.assertEqual(self.bells(self.created - second), [])
+        self.assertEqual(self.bells(self.created), [(self.pk, 6)])
+        self.assertEqual(self.bells(self.edited - second), [(self.pk, 6)])
+        self.assertEqual(self.bells(self.edited), [(self.pk, 8)])
+        self.assertEqual(self.bells(self.deleted - second), [(self.pk, 8)])
+        self.assertEqual(self.bells(self.deleted), [])
+
+    def test_csv(self):
+        lines = list(csv.reader(''.join(export_csv(self.created, 'towers')).splitlines()))
+        row = dict(zip(lines[0], lines[1]))
+        self.assertEqual(len(lines), 2)
+        self.assertEqual((row['place'], row['bells'], row['practice_weeks']), ('Here', '6', '2nd,4th'))
+
+
+class LoadDoveTests(TestCase):
+
+    """
+    load_dove swaps in a fresh copy of a Dove CSV file (which starts with a
+    BOM, and has columns we don't keep), and makes a typed copy of it
+    """
+
+    def write(self, rows):
+        columns = [f.column for f in DoveTower._meta.fields]
+        # Dove's first column, after the BOM, is TowerID
+        header = [columns[0], 'Extra', *reversed(columns[1:])]
+        path = Path(tempfile.mkdtemp()) / 'dove.csv'
+        self.addCleanup(shutil.rmtree, path.parent)
+        with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.DictWriter(f, fieldnames=header, restval='')
+            writer.writeheader()
+            writer.writerows({'Extra': 'ignored', **row} for row in rows)
+        return path
+
+    def load(self, rows):
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('load_dove', file=self.write(rows), stdout=StringIO())
+
+    def test_load(self):
+        self.load([{'TowerID': '100', 'RingID': '1', 'Place': 'Old', 'Bells': '6'}])
+        self.load([{'TowerID': '15878', 'RingID': '5879', 'Place': 'Oakington', 'Bells': '6'},
+                   {'TowerID': '200', 'RingID': '2', 'Place': 'Nowhere', 'Bells': ''}])
+
+        # The second load replaced the first, and left no table behind
+        self.assertEqual(sorted(DoveTower.objects.values_list('ringid', flat=True)), ['2', '5879'])
+        self.assertNotIn('dove_towers_new', connection.introspection.table_names())
+        oakington = DoveTower.objects.get(ringid='5879')
+        self.assertEqual((oakington.towerid, oakington.place, oakington.bells), ('15878', 'Oakington', '6'))
+
+    def test_dove_rings(self):
+        # Typed values, with NULL for blank (or all space) numeric cells
+        self.load([{'TowerID': '15878', 'RingID': '5879', 'Place': 'Oakington', 'County': 'Cambridgeshire',
+                    'Lat': '52.2627', 'Long': '0.0712', 'Bells': ' 6', 'Wt': '1033'},
+                   {'TowerID': '200', 'RingID': '2', 'Place': 'Nowhere', 'Lat': '', 'Long': ' ', 'Bells': '', 'Wt': ''}])
+        oakington, nowhere = DoveRing.objects.get(ringid=5879), DoveRing.objects.get(ringid=2)
+        self.assertEqual((oakington.towerid, oakington.bells, oakington.lat, oakington.long, oakington.wt),
+                         (15878, 6, 52.2627, 0.0712, 1033.0))
+        self.assertEqual((nowhere.lat, nowhere.long, nowhere.bells, nowhere.wt), (None, None, None, None))
+        self.assertEqual((nowhere.county, nowhere.dedicn), ('', ''))
+
+
+class DoveApiTests(TestCase):
+
+    """
+    Paging through the Dove API returns each matching ring once, with just
+    the fields asked for
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        DoveRing.objects.bulk_create(DoveRing(ringid=n, towerid=n, place=f'Place {n}', county='Cambs' if n % 2 else 'Norfolk',
+                                              bells=6 + n % 3) for n in range(1, 12))
+
+    def test_pages(self):
+        url = reverse('database:dove') + '?fields=place&county=Cambs&limit=2'
+        seen = []
+        while url:
+            page = self.client.get(url).json()
+            self.assertTrue(all(set(ring) == {'ringid', 'place'} for ring in page['results']))
+            seen += [ring['ringid'] for ring in page['results']]
+            url = page['next']
+        self.assertEqual(seen, [1, 3, 5, 7, 9, 11])
+
+    def test_bad_field(self):
+        self.assertEqual(self.client.get(reverse('database:dove') + '?fields=secret').status_code, 400)
+
+
+class GridIndexTests(SimpleTestCase):
+
+    """GridIndex.nearest() and within() agree with haversine over every point"""
+
+    def setUp(self):
+        rng = random.Random(14)
+        self.points = [(n, rng.uniform(51.5, 53.5), rng.uniform(-1.0, 2.0)) for n in range(300)]
+        self.points += [(300, 57.5, -4.2), (301, 50.1, -5.5), (302, 52.2, 0.1)]
+        self.index = GridIndex(self.points)
+        # Inside the points, at their edge, and well outside them
+        self.queries = [(52.2, 0.12), (51.5, -1.0), (53.6, 2.1), (58.5, -3.0), (49.0, 6.0)]
+
+    def brute_force(self, lat, lng):
+        return sorted((haversine(lat, lng, plat, plng), pk) for pk, plat, plng in self.points)
+
+    def test_nearest(self):
+        for lat, lng in self.queries:
+            expected = self.brute_force(lat, lng)
+            for k in (1, 10, len(self.points), len(self.points) + 50):
+                with self.subTest(lat=lat, lng=lng, k=k):
+                    self.assertEqual(self.index.nearest(lat, lng, k), expected[:k])
+
+    def test_within(self):
+        for lat, lng in self.queries:
+            expected = self.brute_force(lat, lng)
+            for radius in (0.5, 5, 50, 500):
+                with self.subTest(lat=lat, lng=lng, radius=radius):
+                    self.assertEqual(self.index.within(lat, lng, radius), [p for p in expected if p[0] <= radius])
+
+
+class TourTests(SimpleTestCase):
+
+    """
+    2-opt and Or-opt untangle small routes into the best order, and closed
+    tours include the leg back to the start
+    """
+
+    def matrix(self, points):
+        return [[math.dist(a, b) for b in points] for a in points]
+
+    def test_two_opt_circle(self):
+        # The best tour of points on a circle goes round it
+        points = [(math.cos(n * math.pi / 4), math.sin(n * math.pi / 4)) for n in range(8)]
+        route = [0, 5, 2, 7, 4, 1, 6, 3]
+        self.assertTrue(two_opt(route, self.matrix(points), closed=True))
+        self.assertIn(route, ([0, 1, 2, 3, 4, 5, 6, 7], [0, 7, 6, 5, 4, 3, 2, 1]))
+
+    def test_two_opt_line(self):
+        points = [(x, 0) for x in range(6)]
+        route = [0, 4, 2, 5, 1, 3]
+        two_opt(route, self.matrix(points))
+        self.assertEqual(route, [0, 1, 2, 3, 4, 5])
+
+    def test_or_opt(self):
+        points = [(x, 0) for x in range(5)]
+        route = [0, 2, 3, 1, 4]
+        self.assertTrue(or_opt(route, self.matrix(points)))
+        self.assertEqual(route, [0, 1, 2, 3, 4])
+
+    def test_optimal(self):
+        rng = random.Random(1)
+        points = [(rng.uniform(52.0, 52.6), rng.uniform(-0.2, 0.6)) for n in range(7)]
+        matrix = distance_matrix(points)
+        for closed in (False, True):
+            with self.subTest(closed=closed):
+                best = min(route_length([0, *rest], matrix, closed) for rest in itertools.permutations(range(1, 7)))
+                # Nearest neighbour alone doesn't find it
+                self.assertGreater(route_length(nearest_neighbour(matrix), matrix, closed), best + 0.1)
+                route, legs, finished = plan_tour(points, closed=closed)
+                self.assertTrue(finished)
+                self.assertEqual(route[0], 0)
+                self.assertAlmostEqual(sum(legs), best)
+
+    def test_closed_legs(self):
+        points = [(52.2, 0.1), (52.3, 0.2), (52.25, 0.3)]
+        route, legs, finished = plan_tour(points, closed=True)
+        self.assertEqual(len(legs), 3)
+        self.assertEqual(legs[-1], haversine(*points[route[-1]], *points[route[0]]))
+        route, legs, finished = plan_tour(points)
+        self.assertEqual(len(legs), 2)
+
+
+class MapFeedTests(TestCase):
+
+    """
+    Nearby towers are clustered when zoomed out, and the clusters are
+    rebuilt when a tower changes
+    """
+
+    def setUp(self):
+        Tower.objects.create(place='Here', dedication='St Mary', district='E', lat='52.200', lng='0.100')
+        Tower.objects.create(place='There', dedication='St Mary', district='E', lat='52.210', lng='0.110')
+
+    def features(self, zoom):
+        return self.client.get(reverse('database:map') + f'?zoom={zoom}').json()['features']
+
+    def test_clusters(self):
+        self.assertEqual([f['properties'] for f in self.features(5)], [{'cluster': True, 'count': 2}])
+        self.assertEqual(sorted(f['properties']['name'] for f in self.features(17)), ['Here  (St Mary)', 'There  (St Mary)'])
+
+    def test_invalidation(self):
+        self.features(5)
+        Tower.objects.create(place='Elsewhere', dedication='St Mary', district='E', lat='52.205', lng='0.105')
+        self.assertEqual(self.features(5)[0]['properties']['count'], 3)
+
+
+class ReportTests(TestCase):
+
+    def test_csv_phone2(self):
+        contact = Contact.objects.create(name='A Ringer', phone='01223 000000', phone2='07700 900000', email='a@example.com')
+        tower = Tower.objects.create(place='Here', dedication='St Mary', district='E', primary_contact=contact)
+        row = dict(zip(CSV_COLUMNS, next(csv.reader([render_csv(tower)]))))
+        self.assertEqual((row['Phone'], row['Phone 2'], row['Email']), ('01223 000000', '07700 900000', 'a@example.com'))
+
+
+class DoveMatchTests(TestCase):
+
+    """
+    A tower without a RingID is matched to the right one of several Dove
+    rings, which can then be set with its history
+    """
+
+    def setUp(self):
+        self.tower = Tower.objects.create(place='Great Here-cum-There', county='C', dedication='St John the Baptist',
+                                          district='E', bells=6, os_grid='TL540802', lat='52.399', lng='0.262')
+        DoveRing.objects.create(ringid=1, towerid=11, place='Great Here cum There', county='Cambridgeshire',
+                                dedicn='S John Bapt', bells=6, ringtype='Full-circle ring', ng='TL540802')
+        DoveRing.objects.create(ringid=2, towerid=11, place='Great Here cum There', county='Cambridgeshire',
+                                dedicn='S John Bapt', bells=1, ringtype='Chime', ng='TL540802')
+        DoveRing.objects.create(ringid=3, towerid=12, place='Here', county='Cambridgeshire',
+                                dedicn='S Mary', bells=6, ringtype='Full-circle ring', lat=52.45, long=0.3)
+        DoveRing.objects.create(ringid=4, towerid=13, place='Great Here cum There', county='Norfolk',
+                                dedicn='S John Bapt', bells=6, ringtype='Full-circle ring', ng='TF540802')
+
+    def test_suggestions(self):
+        [(tower, scored)] = suggest_matches([self.tower])
+        self.assertEqual([ring['ringid'] for total, parts, ring in scored], [1, 2, 3])
+        self.assertTrue(is_confident(scored))
+
+    def test_apply(self):
+        [(tower, scored)] = suggest_matches([self.tower])
+        self.assertEqual(apply_matches([(tower, scored[0][2])]), 1)
+        self.tower.refresh_from_db()
+        self.assertEqual((self.tower.dove_ringid, self.tower.dove_towerid), ('1', '11'))
+        change = TowerChange.objects.filter(tower_id=self.tower.pk).first()
+        self.assertEqual(change.changes, [['dove_towerid', '', '11'], ['dove_ringid', '', '1']])
+
+    def test_apply_keeps_existing(self):
+        self.tower.dove_ringid, self.tower.dove_towerid = '99', '98'
+        self.tower.save()
+        [(tower, scored)] = suggest_matches([self.tower])
+        self.assertEqual(apply_matches([(tower, scored[0][2])]), 0)
+        self.tower.refresh_from_db()
+        self.assertEqual((self.tower.dove_ringid, self.tower.dove_towerid), ('99', '98'))
+
+
+class ReconcileTests(TestCase):
+
+    """
+    Differences from Dove are saved, only changed towers are checked again,
+    and towers with open ones can be picked out in the admin
+    """
+
+    def setUp(self):
+        self.tower = Tower.objects.create(place='Here', county='C', dedication='St Mary', district='E', bells=6,
+                                          ringing_status='N', gf=False, dove_towerid='11', dove_ringid='1')
+        self.dove = SimpleNamespace(ringid='1', towerid='11', place='Here', county='Cambridgeshire', dedicn='S Mary',
+                                    ur='', bells='8', ringtype='Full-circle ring', gf='', ng='', postcode='',
+                                    towerbase='', diocese='Ely', affiliations='Ely Diocesan Association')
+
+    def get_dove(self, ringid):
+        return self.dove if ringid == self.dove.ringid else None
+
+    def test_incremental(self):
+        self.assertEqual(reconcile([self.tower], self.get_dove), 1)
+        issue = ReconcileIssue.objects.get()
+        self.assertEqual((issue.test, issue.ours, issue.theirs, issue.resolved_at), ('Bells', '6', '8', None))
+
+        self.assertEqual(reconcile([self.tower], self.get_dove), 0)
+        self.assertEqual(reconcile([self.tower], self.get_dove, full=True), 1)
+        self.assertEqual(ReconcileIssue.objects.get().pk, issue.pk)
+
+        self.dove.bells = '6'
+        self.assertEqual(reconcile([self.tower], self.get_dove), 1)
+        self.assertIsNotNone(ReconcileIssue.objects.get().resolved_at)
+
+    def test_admin_filter(self):
+        reconcile([self.tower], self.get_dove)
+        Tower.objects.create(place='There', county='C', dedication='St Mary', district='E')
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        response = self.client.get(reverse('admin:database_tower_changelist') + '?dove_issues=open')
+        self.assertEqual(list(response.context['cl'].result_list), [self.tower])
@@ -0,0 +1,132 @@
+from itertools import pairwise
+import time
+
+from .geo import distance_matrix
+
+
+def route_length(route, matrix, closed=False):
+    """Total miles along route (a list of indexes into matrix)"""
+    legs = route + route[:1] if closed else route
+    return sum(matrix[a][b] for a, b in pairwise(legs))
+
+
+def nearest_neighbour(matrix, start=0):
+
+    """
+    A route through every point, starting at start and always going to the
+    nearest point not yet visited
+    """
+
+    unvisited = set(range(len(matrix))) - {start}
+    route = [start]
+    while unvisited:
+        row = matrix[route[-1]]
+        here = min(unvisited, key=row.__getitem__)
+        route.append(here)
+        unvisited.remove(here)
+    return route
+
+
+def two_opt(route, matrix, closed=False, deadline=None):
+
+    """
+    Improve route in place by reversing stretches of it wherever that makes
+    it shorter, until no reversal helps or the deadline (a perf_counter()
+    time) passes. The first point stays first.
+    """
+
+    n = len(route)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 1):
+            if deadline and time.perf_counter() > deadline:
+                return False
+            a, b = route[i - 1], route[i]
+            row_a, row_b = matrix[a], matrix[b]
+            ab = row_a[b]
+            for j in range(i + 1, n):
+                c = route[j]
+                # The point after the stretch, if any
+                d = route[j + 1] if j + 1 < n else (route[0] if closed else None)
+                if d is None:
+                    delta = row_a[c] - ab
+                else:
+                    row_c = matrix[c]
+                    delta = row_a[c] + row_b[d] - ab - row_c[d]
+                if delta < -1e-9:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    b = route[i]
+                    row_b = matrix[b]
+                    ab = row_a[b]
+                    improved = True
+    return True
+
+
+def or_opt(route, matrix, closed=False, deadline=None):
+
+    """
+    Improve route in place by moving runs of one to three points, possibly
+    reversed, to wherever they make it shorter. Returns False if the
+    deadline passed first.
+    """
+
+    def dist(a, b):
+        return 0 if a is None or b is None else matrix[a][b]
+
+    n = len(route)
+    improved = True
+    while improved:
+        improved = False
+        for length in (1, 2, 3):
+            for i in range(1, n - length + 1):
+                if deadline and time.perf_counter() > deadline:
+                    return False
+                run = route[i:i + length]
+                before = route[i - 1]
+                after = route[i + length] if i + length < n else (route[0] if closed else None)
+                removed = dist(before, run[0]) + dist(run[-1], after) - dist(before, after)
+                rest = route[:i] + route[i + length:]
+                best = None
+                for k in range(len(rest)):
+                    p = rest[k]
+                    q = rest[k + 1] if k + 1 < len(rest) else (rest[0] if closed else None)
+                    for candidate in (run, run[::-1]):
+                        gain = removed - (dist(p, candidate[0]) + dist(candidate[-1], q) - dist(p, q))
+                        if gain > 1e-9 and (best is None or gain > best[0]):
+                            best = (gain, k, candidate)
+                if best:
+                    gain, k, candidate = best
+                    route[:] = rest[:k + 1] + candidate + rest[k + 1:]
+                    improved = True
+    return True
+
+
+def plan_tour(points, start=0, closed=False, time_limit=2.0):
+
+    """
+    Order (lat, lng) points to keep the total distance short, starting from
+    points[start] (and returning to it if closed). Uses nearest neighbour
+    and then 2-opt and Or-opt for up to time_limit seconds. Returns the
+    route as a list of indexes into points, the list of leg distances in
+    miles, and whether the improvement finished within the time limit.
+    """
+
+    deadline = time.perf_counter() + time_limit
+    matrix = distance_matrix(points)
+    if not points:
+        return [], [], True
+
+    route = nearest_neighbour(matrix, start)
+    finished = False
+    while not finished:
+        length = route_length(route, matrix, closed)
+        finished = two_opt(route, matrix, closed, deadline) and or_opt(route, matrix, closed, deadline)
+        if finished and route_length(route, matrix, closed) < length - 1e-9:
+            # Or-opt may have opened up new 2-opt moves
+            finished = False
+        elif not finished:
+            break
+
+    legs = route + route[:1] if closed else route
+    return route, [matrix[a][b] for a, b in pairwise(legs)], finished
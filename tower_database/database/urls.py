@@ -0,0 +1,14 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'database'
+
+urlpatterns = [
+    path('practices/', views.practices, name='practices'),
+    path('as-of/', views.as_of, name='as_of'),
+    path('towers/', views.towers, name='towers'),
+    path('towers/<int:pk>/', views.tower, name='tower'),
+    path('dove/', views.dove, name='dove'),
+    path('map/', views.map_feed, name='map'),
+]
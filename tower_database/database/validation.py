@@ -0,0 +1,75 @@
+from django.core.exceptions import ValidationError
+
+from collections import defaultdict
+
+# Fields whose validation needs the database (the primary_contact FK
+# existence check), which the database enforces anyway
+EXCLUDE = {'primary_contact'}
+
+
+def validate_tower(tower):
+
+    """
+    Validate one tower as full_clean() would (field checks, each field's
+    validators and the cross-field checks in Tower.clean()), but without
+    querying the database and recording which rule each error came from.
+    Returns a list of (field, rule, message).
+    """
+
+    errors = []
+
+    for field in tower._meta.concrete_fields:
+        if field.name in EXCLUDE or field.primary_key:
+            continue
+        raw_value = getattr(tower, field.attname)
+        # As Model.clean_fields(), don't validate blank values of blank fields
+        if field.blank and raw_value in field.empty_values:
+            continue
+        try:
+            value = field.to_python(raw_value)
+            field.validate(value, tower)
+        except ValidationError as e:
+            errors.extend((field.name, e.code or 'invalid', m) for m in e.messages)
+            continue
+        for validator in field.validators:
+            try:
+                validator(value)
+            except ValidationError as e:
+                rule = getattr(validator, '__name__', type(validator).__name__)
+                errors.extend((field.name, rule, m) for m in e.messages)
+
+    try:
+        tower.clean()
+    except ValidationError as e:
+        for field, messages in e.message_dict.items():
+            errors.extend((field, 'clean', m) for m in messages)
+
+    return errors
+
+
+def validate_towers(towers):
+
+    """
+    Validate a list of towers, returning a list of error dicts. Module
+    level so that it can be run in a worker process.
+    """
+
+    return [{'id': tower.pk, 'tower': str(tower), 'field': field, 'rule': rule, 'message': message}
+            for tower in towers
+            for field, rule, message in validate_tower(tower)]
+
+
+def duplicate_towers(towers):
+
+    """
+    The unique_place_dedication constraint, checked in memory
+    """
+
+    seen = defaultdict(list)
+    for tower in towers:
+        seen[(tower.place, tower.dedication)].append(tower)
+
+    return [{'id': tower.pk, 'tower': str(tower), 'field': 'place', 'rule': 'unique_place_dedication',
+             'message': "Can't have two towers with the same place and dedication"}
+            for duplicates in seen.values() if len(duplicates) > 1
+            for tower in duplicates]
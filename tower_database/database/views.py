@@ -1,3 +1,197 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.views.decorators.http import condition, require_GET
+
+import datetime
+
+from .api import cached_tower_payloads, data_version, version_tag
+from .calendar import practices_between
+from .mapfeed import MAX_ZOOM, POINTS, geojson, get_cluster_index, kml
+from .models import DoveRing, Tower
+from .snapshot import TABLES, export_csv, export_json, parse_when
 
 # Create your views here.
+
+# Longest date range a single request can ask for
+MAX_DAYS = 366
+
+# Dove rings per page, by default and at most
+DOVE_PAGE_SIZE = 100
+MAX_DOVE_PAGE_SIZE = 1000
+
+
+@require_GET
+def practices(request):
+
+    """
+    Which towers have practices on ?date=YYYY-MM-DD, or on each day from
+    ?start= to ?end= (inclusive)
+    """
+
+    try:
+        if 'date' in request.GET:
+            start = end = datetime.date.fromisoformat(request.GET['date'])
+        else:
+            start = datetime.date.fromisoformat(request.GET['start'])
+            end = datetime.date.fromisoformat(request.GET['end'])
+    except (KeyError, ValueError):
+        return JsonResponse({'error': "Give 'date', or 'start' and 'end', as YYYY-MM-DD"}, status=400)
+
+    if end < start or (end - start).days >= MAX_DAYS:
+        return JsonResponse({'error': f"'end' must be after 'start' and at most {MAX_DAYS} days later"}, status=400)
+
+    dates = practices_between(start, end)
+
+    tower_ids = {tower_id for date, ids in dates for tower_id in ids}
+    towers = {
+        tower.pk: {
+            'place': tower.place,
+            'dedication': tower.dedication,
+            'practice': tower.practice,
+            # Practices in alternate weeks appear on every such weekday
+            'check': tower.travel_check or Tower.PracticeWeeks.ALT in tower.practice_weeks,
+        }
+        for tower in Tower.objects.filter(pk__in=tower_ids)
+    }
+
+    return JsonResponse({
+        'start': start,
+        'end': end,
+        'dates': [{'date': date, 'towers': ids} for date, ids in dates],
+        'towers': towers,
+    })
+
+
+@require_GET
+@staff_member_required
+def as_of(request):
+
+    """
+    Towers, contacts and websites as they were at ?when= (YYYY-MM-DD or an
+    ISO date and time), as JSON or, with ?format=csv, the CSV of one
+    ?table= (default towers). Staff only, as it includes contact details.
+    """
+
+    when = parse_when(request.GET.get('when', ''))
+    if when is None:
+        return JsonResponse({'error': "Give 'when' as YYYY-MM-DD or YYYY-MM-DDTHH:MM[:SS]"}, status=400)
+
+    tables = request.GET.getlist('table')
+    if any(table not in TABLES for table in tables):
+        return JsonResponse({'error': f"'table' must be one of {', '.join(TABLES)}"}, status=400)
+
+    if request.GET.get('format') == 'csv':
+        if len(tables) > 1:
+            return JsonResponse({'error': "A CSV export can only contain one table"}, status=400)
+        table = tables[0] if tables else 'towers'
+        response = StreamingHttpResponse(export_csv(when, table), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="{table}-{when:%Y%m%d%H%M%S}.csv"'
+        return response
+
+    return StreamingHttpResponse(export_json(when, tables), content_type='application/json')
+
+
+def request_data_version(request):
+    # Looked up once per request, although the ETag, Last-Modified and
+    # response all need it
+    if not hasattr(request, 'data_version'):
+        request.data_version = data_version()
+    return request.data_version
+
+
+def data_etag(request, *args, **kwargs):
+    return f'"{version_tag(request_data_version(request))}"'
+
+
+def data_last_modified(request, *args, **kwargs):
+    return request_data_version(request)[1]
+
+
+@require_GET
+@condition(etag_func=data_etag, last_modified_func=data_last_modified)
+def towers(request):
+    """Every tower, with its websites and published contacts"""
+    return JsonResponse(list(cached_tower_payloads(request_data_version(request)).values()), safe=False)
+
+
+@require_GET
+@condition(etag_func=data_etag, last_modified_func=data_last_modified)
+def tower(request, pk):
+    """One tower, with its websites and published contacts"""
+    payload = cached_tower_payloads(request_data_version(request)).get(pk)
+    if payload is None:
+        return JsonResponse({'error': f"No tower {pk}"}, status=404)
+    return JsonResponse(payload)
+
+
+@require_GET
+def dove(request):
+
+    """
+    A page of Dove rings in RingID order, starting after ?after=<RingID>,
+    with only the ?fields= (comma-separated) asked for, and optionally only
+    those with a given ?county=, ?diocese= or ?bells=. Each page is found
+    from the RingID index, so later pages cost no more than the first.
+    """
+
+    names = {f.name for f in DoveRing._meta.fields}
+    fields = [f for f in request.GET.get('fields', '').split(',') if f]
+    unknown = [f for f in fields if f not in names]
+    if unknown:
+        return JsonResponse({'error': f"Unknown field(s): {', '.join(unknown)}"}, status=400)
+    fields = ['ringid'] + [f for f in fields if f != 'ringid'] if fields else [f.name for f in DoveRing._meta.fields]
+
+    try:
+        after = int(request.GET.get('after', 0))
+        limit = int(request.GET.get('limit', DOVE_PAGE_SIZE))
+        bells = int(request.GET['bells']) if 'bells' in request.GET else None
+    except ValueError:
+        return JsonResponse({'error': "'after', 'limit' and 'bells' must be whole numbers"}, status=400)
+    if not 1 <= limit <= MAX_DOVE_PAGE_SIZE:
+        return JsonResponse({'error': f"'limit' must be from 1 to {MAX_DOVE_PAGE_SIZE}"}, status=400)
+
+    rings = DoveRing.objects.filter(ringid__gt=after)
+    for name in ('county', 'diocese'):
+        if name in request.GET:
+            rings = rings.filter(**{name: request.GET[name]})
+    if bells is not None:
+        rings = rings.filter(bells=bells)
+
+    page = list(rings.order_by('ringid').values(*fields)[:limit])
+
+    next_page = None
+    if len(page) == limit:
+        query = request.GET.copy()
+        query['after'] = page[-1]['ringid']
+        next_page = request.build_absolute_uri(f'{request.path}?{query.urlencode()}')
+
+    return JsonResponse({'results': page, 'next': next_page})
+
+
+@require_GET
+def map_feed(request):
+
+    """
+    Towers (or, with ?kind=dove, Dove rings) as GeoJSON or, with
+    ?format=kml, KML. With ?zoom= nearby points are clustered as they would
+    be at that zoom level, and ?bbox=west,south,east,north limits them to a
+    map's viewport.
+    """
+
+    kind = request.GET.get('kind', 'tower')
+    if kind not in POINTS:
+        return JsonResponse({'error': f"'kind' must be one of {', '.join(POINTS)}"}, status=400)
+    try:
+        zoom = int(request.GET.get('zoom', MAX_ZOOM + 1))
+        bbox = [float(v) for v in request.GET['bbox'].split(',')] if 'bbox' in request.GET else None
+        if bbox is not None and len(bbox) != 4:
+            raise ValueError
+    except ValueError:
+        return JsonResponse({'error': "'zoom' must be a whole number and 'bbox' west,south,east,north"}, status=400)
+
+    features = get_cluster_index(kind).features(zoom, bbox)
+    if request.GET.get('format') == 'kml':
+        return HttpResponse(kml(features, 'Dove towers' if kind == 'dove' else 'Towers'),
+                            content_type='application/vnd.google-earth.kml+xml')
+    return HttpResponse(geojson(features), content_type='application/geo+json')
@@ -127,3 +127,27 @@ STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# Where downloads of the master list and Dove are cached between runs
+FETCH_CACHE_DIR = BASE_DIR / 'fetch_cache'
+
+# Rendered Annual Report entries are kept on disk, so that each run of
+# annual_report only has to render the towers that have changed. API
+# responses are kept on disk too, cached against the data version (which is
+# in the database), so that every process shares them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'reports': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'report_cache',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 5000},
+    },
+    'api': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'api_cache',
+        'TIMEOUT': None,
+    },
+}
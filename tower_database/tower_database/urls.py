@@ -17,7 +17,7 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.contrib.auth import views as auth_views
-from django.urls import path
+from django.urls import include, path
 
 urlpatterns = [
 
@@ -54,4 +54,6 @@ urlpatterns = [
 
     path('admin/', admin.site.urls),
 
+    path('api/', include('database.urls')),
+
 ]